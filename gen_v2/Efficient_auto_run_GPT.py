@@ -1,5 +1,4 @@
-import subprocess
-import sys
+from worker import WorkerClient
 
 model_parameters = ['GPT4o']
 # persona_type = 'persona-none'
@@ -86,19 +85,14 @@ def generate_commands(max_rows=200):
 
 
 def run_command_for_model(model, commands):
-    for command in commands:
-        full_command = [sys.executable, 'systematic_evaluation.py', '--models', model] + command
-        print(f"Running command for model {model}: {' '.join(full_command)}")
-
-        try:
-            result = subprocess.run(full_command, check=True, text=True, capture_output=True)
-
-            print(f"Standard Output for {model}:\n{result.stdout}")
-            print(f"Standard Error for {model}:\n{result.stderr}")
-
-        except subprocess.CalledProcessError as e:
-            print(f"Error occurred while running model {model}.\nError Message: {e.stderr}")
-            return e.returncode
+    # One worker per model: the model is loaded once and every config runs against it.
+    with WorkerClient(model) as worker:
+        for command in commands:
+            print(f"Running config for model {model}: {' '.join(command)}")
+            error = worker.run(command)
+            if error is not None:
+                print(f"Error occurred while running model {model}.\nError Message: {error}")
+                return 1
 
     return 0
 
@@ -1,4 +1,4 @@
-import subprocess
+from worker import WorkerClient
 from concurrent.futures import ThreadPoolExecutor
 
 
@@ -39,12 +39,12 @@ commands = [
 
 
 def run_command_for_model(model):
-    for command in commands:
-        full_command = ['python', 'systematic_evaluation.py', '--models', model] + command
-        print(f"Running command for model {model}: {' '.join(full_command)}")
-        result = subprocess.run(full_command, capture_output=True, text=True)
-        print(f"Standard Output for {model}:\n{result.stdout}")
-        print(f"Standard Error for {model}:\n{result.stderr}")
+    with WorkerClient(model) as worker:
+        for command in commands:
+            print(f"Running config for model {model}: {' '.join(command)}")
+            error = worker.run(command)
+            if error is not None:
+                print(f"Error occurred while running model {model}.\nError Message: {error}")
 
 with ThreadPoolExecutor(max_workers=len(model_parameters)) as executor:
     executor.map(run_command_for_model, model_parameters)
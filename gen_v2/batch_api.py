@@ -0,0 +1,197 @@
+import abc
+import hashlib
+import json
+import os
+import time
+
+from gpt import FAILED_RESPONSE, GPT, Claude
+
+
+class BatchRunner(abc.ABC):
+    # Submits every prompt of one config as a single provider-side batch and waits for it.
+    # The batch id is kept in batch_state.json next to the results, so an interrupted run
+    # resumes polling the same batch instead of paying for it twice.
+    def __init__(self, model, work_dir, poll_interval=30):
+        self.model = model
+        self.work_dir = work_dir
+        self.poll_interval = poll_interval
+        self.state_path = os.path.join(work_dir, 'batch_state.json')
+
+    def run(self, queries):
+        results = {}
+        requests = []
+        for count, query in queries:
+            system_prompt, user_prompt = self.model.split_prompt(query, mode='basic')
+            cached = self._cache_get(system_prompt, user_prompt)
+            if cached is not None:
+                results[count] = (system_prompt + user_prompt, cached)
+            else:
+                requests.append((f"request-{count}", count, system_prompt, user_prompt))
+
+        print(f"{len(results)} prompts answered from cache, {len(requests)} sent as a batch.")
+        if not requests:
+            return results
+
+        fingerprint = self._fingerprint(requests)
+        state = self._load_state()
+        if state.get('fingerprint') == fingerprint and state.get('batch_id'):
+            batch_id = state['batch_id']
+            print(f"Resuming batch {batch_id}.")
+        else:
+            batch_id = self.submit(requests)
+            self._save_state({'fingerprint': fingerprint, 'batch_id': batch_id, 'submitted': time.time()})
+            print(f"Submitted batch {batch_id} with {len(requests)} requests.")
+
+        while True:
+            status, done = self.status(batch_id)
+            print(f"Batch {batch_id}: {status}")
+            if done:
+                break
+            time.sleep(self.poll_interval)
+
+        answers = self.fetch(batch_id)
+        for custom_id, count, system_prompt, user_prompt in requests:
+            answer = answers.get(custom_id) or FAILED_RESPONSE
+            if answer != FAILED_RESPONSE:
+                self._cache_put(system_prompt, user_prompt, answer)
+            results[count] = (system_prompt + user_prompt, answer)
+
+        self._save_state({'fingerprint': fingerprint, 'batch_id': batch_id, 'finished': time.time()})
+        return results
+
+    @abc.abstractmethod
+    def submit(self, requests):
+        # Sends [(custom_id, count, system_prompt, user_prompt)] as one batch; returns its id.
+        ...
+
+    @abc.abstractmethod
+    def status(self, batch_id):
+        # (printable status, True once the batch will not change any more).
+        ...
+
+    @abc.abstractmethod
+    def fetch(self, batch_id):
+        # {custom_id: answer} of the requests that succeeded.
+        ...
+
+    def _cache_get(self, system_prompt, user_prompt):
+        cache = self.model.cache
+        if cache is None:
+            return None
+        return cache.get(cache.make_key(self.model.model_id, system_prompt, user_prompt, self.model.generation_params))
+
+    def _cache_put(self, system_prompt, user_prompt, answer):
+        cache = self.model.cache
+        if cache is not None:
+            cache.put(cache.make_key(self.model.model_id, system_prompt, user_prompt, self.model.generation_params),
+                      answer)
+
+    def _fingerprint(self, requests):
+        digest = hashlib.sha256(self.model.model_id.encode('utf-8'))
+        for custom_id, _, system_prompt, user_prompt in requests:
+            digest.update(json.dumps([custom_id, system_prompt, user_prompt], ensure_ascii=False).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_state(self, state):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+
+class OpenAIBatchRunner(BatchRunner):
+    endpoint = '/v1/chat/completions'
+
+    def submit(self, requests):
+        input_path = os.path.join(self.work_dir, 'batch_input.jsonl')
+        with open(input_path, 'w', encoding='utf-8') as f:
+            for custom_id, _, system_prompt, user_prompt in requests:
+                body = {
+                    'model': self.model.model_id,
+                    'messages': [
+                        {'role': 'system', 'content': system_prompt},
+                        {'role': 'user', 'content': user_prompt},
+                    ],
+                    **self.model.generation_params,
+                }
+                f.write(json.dumps({'custom_id': custom_id, 'method': 'POST', 'url': self.endpoint,
+                                    'body': body}, ensure_ascii=False) + '\n')
+
+        client = self.model.client
+        with open(input_path, 'rb') as f:
+            batch_file = client.files.create(file=f, purpose='batch')
+        batch = client.batches.create(input_file_id=batch_file.id, endpoint=self.endpoint,
+                                      completion_window='24h')
+        return batch.id
+
+    def status(self, batch_id):
+        batch = self.model.client.batches.retrieve(batch_id)
+        return batch.status, batch.status in ('completed', 'failed', 'expired', 'cancelled')
+
+    def fetch(self, batch_id):
+        client = self.model.client
+        batch = client.batches.retrieve(batch_id)
+        answers = {}
+        if batch.output_file_id:
+            for line in client.files.content(batch.output_file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get('response') or {}
+                if response.get('status_code') == 200:
+                    answers[record['custom_id']] = response['body']['choices'][0]['message']['content']
+                else:
+                    print(f"Batch request {record['custom_id']} failed: {record.get('error') or response}")
+        if batch.error_file_id:
+            for line in client.files.content(batch.error_file_id).text.splitlines():
+                if line.strip():
+                    record = json.loads(line)
+                    print(f"Batch request {record['custom_id']} failed: {record.get('error')}")
+        return answers
+
+
+class AnthropicBatchRunner(BatchRunner):
+    def submit(self, requests):
+        batch = self.model.client.messages.batches.create(requests=[
+            {
+                'custom_id': custom_id,
+                'params': {
+                    'model': self.model.model_id,
+                    'system': system_prompt,
+                    'messages': [{'role': 'user', 'content': self.model.user_content(user_prompt)}],
+                    **self.model.generation_params,
+                },
+            }
+            for custom_id, _, system_prompt, user_prompt in requests
+        ])
+        return batch.id
+
+    def status(self, batch_id):
+        batch = self.model.client.messages.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        status = (f"{batch.processing_status} ({counts.succeeded} succeeded, {counts.errored} errored, "
+                  f"{counts.processing} processing)")
+        return status, batch.processing_status == 'ended'
+
+    def fetch(self, batch_id):
+        answers = {}
+        for entry in self.model.client.messages.batches.results(batch_id):
+            if entry.result.type == 'succeeded':
+                answers[entry.custom_id] = entry.result.message.content[0].text
+            else:
+                print(f"Batch request {entry.custom_id} {entry.result.type}: {getattr(entry.result, 'error', '')}")
+        return answers
+
+
+def batch_runner(model, work_dir, poll_interval=30):
+    if isinstance(model, GPT):
+        return OpenAIBatchRunner(model, work_dir, poll_interval)
+    if isinstance(model, Claude):
+        return AnthropicBatchRunner(model, work_dir, poll_interval)
+    raise ValueError(f"{type(model).__name__} does not support --batch")
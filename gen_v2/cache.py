@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def prompt_hash(prompt_text):
+    # Identifies a fully rendered prompt independently of the model that answers it.
+    return hashlib.sha256(prompt_text.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    # Check the real on-disk size every this many writes; other processes share the file.
+    evict_check_interval = 100
+
+    def __init__(self, path, max_bytes=1024 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                     'key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        conn.commit()
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads, so keep one per thread.
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self.local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(model_id, system_prompt, user_prompt, params):
+        payload = json.dumps([model_id, system_prompt, user_prompt, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+        with self.lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            return None
+
+        conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (time.time(), key))
+        conn.commit()
+        return row[0]
+
+    def put(self, key, response):
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO responses (key, response, size, accessed) VALUES (?, ?, ?, ?)',
+                     (key, response, len(response.encode('utf-8')), time.time()))
+        conn.commit()
+
+        with self.lock:
+            self.writes += 1
+            check = self.writes % self.evict_check_interval == 0
+        if check:
+            self.evict()
+
+    def evict(self):
+        # Drop least recently used entries until the cache is back under 90% of max_bytes.
+        conn = self._connection()
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        keys = []
+        for key, size in conn.execute('SELECT key, size FROM responses ORDER BY accessed'):
+            keys.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        conn.executemany('DELETE FROM responses WHERE key = ?', keys)
+        conn.commit()
+        print(f"Response cache: evicted {len(keys)} entries ({freed / 1024 / 1024:.1f} MB)")
+
+    def report(self):
+        conn = self._connection()
+        entries, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return (f"Response cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1%} hit rate), "
+                f"{entries} entries, {total / 1024 / 1024:.1f} MB in {self.path}")
@@ -1,9 +1,16 @@
-from collections import Counter
-from sklearn.utils import resample
 import datasets
+import numpy as np
+import os
+import pyarrow as pa
+import pyarrow.compute as pc
+import shutil
+import tempfile
 
+# Local Arrow snapshots of the hub datasets, one directory per <hub name>/<revision>.
+SNAPSHOT_DIR = '../cache/datasets'
 
-def load_dataset(dataset_name: str) -> datasets.Dataset:
+
+def hub_name(dataset_name: str) -> str:
     huggingface_name = 'KAIST-IC-LAB721/'
     dataset = ''
 
@@ -20,38 +27,103 @@ def load_dataset(dataset_name: str) -> datasets.Dataset:
     elif dataset_name == "goemotion":
         dataset = 'GoEmotion-Single'
 
-    return datasets.load_dataset(huggingface_name + dataset)
-def is_2d_list(lst):
-    return all(isinstance(i, list) for i in lst)
+    return huggingface_name + dataset
+
+
+def snapshot_path(repo_id: str, revision='main', root=SNAPSHOT_DIR) -> str:
+    return os.path.join(root, repo_id, revision)
+
+
+def save_snapshot(dataset, repo_id: str, revision='main', root=SNAPSHOT_DIR) -> str:
+    if isinstance(dataset, datasets.Dataset):
+        dataset = datasets.DatasetDict({'train': dataset})
+    path = snapshot_path(repo_id, revision, root)
+    # Write next to the final location and swap it in, so a crash never leaves a half-written snapshot.
+    # Each process writes a directory of its own; when another one (e.g. a parallel auto_run worker)
+    # has put the same snapshot in place first, its copy is kept and ours discarded.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path), prefix=f"{revision}.", suffix='.tmp')
+    try:
+        dataset.save_to_disk(tmp_path)
+        if not os.path.exists(path):
+            os.replace(tmp_path, path)
+    except OSError:
+        if not os.path.exists(path):
+            raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return path
+
+
+def load_dataset(dataset_name: str, revision='main', snapshot_dir=SNAPSHOT_DIR) -> datasets.DatasetDict:
+    # The hub is only contacted the first time a (dataset, revision) is used; after that the
+    # snapshot is opened from disk, memory-mapped, without any network access.
+    repo_id = hub_name(dataset_name)
+    path = snapshot_path(repo_id, revision, snapshot_dir)
+    if not os.path.exists(path):
+        save_snapshot(datasets.load_dataset(repo_id, revision=revision), repo_id, revision, snapshot_dir)
+    return datasets.load_from_disk(path)
+
+
+def read_labels(split: datasets.Dataset, column='label'):
+    # (row, label) pairs of a label column as two arrays, read straight from Arrow.
+    # Multi-label columns (a list per row) give one pair per label of the row.
+    labels = split.with_format('arrow')[column]
+    if not (pa.types.is_list(labels.type) or pa.types.is_large_list(labels.type)):
+        values = labels.to_numpy()
+        return np.arange(len(values)), values
+    lengths = pc.fill_null(pc.list_value_length(labels), 0).to_numpy()
+    return np.repeat(np.arange(len(lengths)), lengths), pc.list_flatten(labels).to_numpy()
+
+
+def stratified_sample(rows, values, num_rows, max_rows, seed=42, replace='auto'):
+    # Up to max_rows // num_labels distinct rows per label, then distinct rows of any label to reach max_rows.
+    # replace: 'auto' tops up labels with too few rows by sampling them again with replacement,
+    # 'with' samples every label with replacement, 'without' never repeats a row.
+    # Rows are grouped by label code with one sort, so this is O(N log N) in the number of (row, label) pairs.
+    codes = np.unique(values, return_inverse=True)[1].reshape(-1)
+    order = np.argsort(codes, kind='stable')
+    groups = np.split(rows[order], np.flatnonzero(np.diff(codes[order])) + 1)
+    rows_per_label = max_rows // len(groups)
+    rng = np.random.default_rng(seed)
+
+    taken = np.zeros(num_rows, dtype=bool)
+    sampled = []
+    # Rarest labels first, so rows carrying several labels are not all used up by the common ones.
+    for group in sorted(groups, key=len):
+        group = np.unique(group)
+        if replace == 'with':
+            chosen = rng.choice(group, rows_per_label, replace=True)
+        else:
+            candidates = group[~taken[group]]
+            chosen = rng.choice(candidates, min(rows_per_label, len(candidates)), replace=False)
+            if replace == 'auto' and len(chosen) < rows_per_label:
+                chosen = np.concatenate([chosen, rng.choice(group, rows_per_label - len(chosen), replace=True)])
+        taken[chosen] = True
+        sampled.append(chosen)
 
+    missing = max_rows - sum(len(chosen) for chosen in sampled)
+    if missing > 0:
+        remaining = np.flatnonzero(~taken)
+        sampled.append(rng.choice(remaining, min(missing, len(remaining)), replace=False))
 
-def balanced_sampling(data, labels, max_rows):
-    if is_2d_list(labels):
-        labels = [item for sublist in labels for item in sublist]
-    label_counts = Counter(labels)
-    num_labels = len(label_counts)
-    rows_per_label = max_rows // num_labels
+    return np.concatenate(sampled).tolist()
 
-    sampled_indices = []
 
-    for label, count in label_counts.items():
-        label_indices = [i for i, lbl in enumerate(labels) if lbl == label]
+def balanced_sampling(split: datasets.Dataset, max_rows, seed=42, replace='auto'):
+    rows, values = read_labels(split)
+    return stratified_sample(rows, values, len(split), max_rows, seed=seed, replace=replace)
 
-        if count >= rows_per_label:
-            sampled_indices.extend(resample(label_indices, replace=False, n_samples=rows_per_label, random_state=42))
-        else:
-            sampled_indices.extend(resample(label_indices, replace=True, n_samples=rows_per_label, random_state=42))
 
-    if len(sampled_indices) < max_rows:
-        remaining_indices = list(set(range(len(labels))) - set(sampled_indices))
-        additional_samples = resample(remaining_indices, replace=False, n_samples=max_rows - len(sampled_indices),
-                                      random_state=42)
-        sampled_indices.extend(additional_samples)
+def take(dataset: datasets.Dataset, indices, columns):
+    # Fetch the sampled rows with one select and one read per column, instead of
+    # materializing a whole column for every sampled row.
+    rows = dataset.select(indices)
+    return {column: rows[column] for column in columns}
 
-    return sampled_indices
 
-
-def preprocess_data_with_balanced_sampling(dataset_name: str, dataset: datasets.Dataset, max_rows=200):
+def preprocess_data_with_balanced_sampling(dataset_name: str, dataset: datasets.Dataset, max_rows=200, seed=42,
+                                           replace='auto'):
     if len(dataset['train']) < max_rows:
         max_rows = len(dataset['train'])
 
@@ -59,14 +131,14 @@ def preprocess_data_with_balanced_sampling(dataset_name: str, dataset: datasets.
             'cause': [], 'cause_text': [], 'subject': [], 'label_list': []}
 
     if dataset_name == "iemocap":
-        labels = dataset['train']['label']
-        sampled_indices = balanced_sampling(dataset['train'], labels, max_rows)
+        sampled_indices = balanced_sampling(dataset['train'], max_rows, seed=seed, replace=replace)
 
         num_label_info = {0: 'happy', 1: 'sad', 2: 'neutral', 3: 'angry', 4: 'excited', 5: 'frustrated'}
-        for idx in sampled_indices:
-            data['context'].append({i: j for i, j in enumerate(dataset['train']['conversation'][idx])})
-            data['label'].append({i: j for i, j in enumerate(dataset['train']['label'][idx])})
-            data['label_text'].append({i: j for i, j in enumerate(dataset['train']['label_text'][idx])})
+        rows = take(dataset['train'], sampled_indices, ['conversation', 'label', 'label_text'])
+        for conversation, label, label_text in zip(rows['conversation'], rows['label'], rows['label_text']):
+            data['context'].append({i: j for i, j in enumerate(conversation)})
+            data['label'].append({i: j for i, j in enumerate(label)})
+            data['label_text'].append({i: j for i, j in enumerate(label_text)})
             data['label_list'].append(num_label_info)
 
 
@@ -79,53 +151,48 @@ def preprocess_data_with_balanced_sampling(dataset_name: str, dataset: datasets.
         data['subject'].extend(dataset['subject'])
 
     elif dataset_name == "dreaddit":
-        labels = dataset['train']['label']
-        sampled_indices = balanced_sampling(dataset['train'], labels, max_rows)
+        sampled_indices = balanced_sampling(dataset['train'], max_rows, seed=seed, replace=replace)
 
         num_label_info = {0: 'yes', 1: 'no'}
         num_label_info = list(num_label_info.values())
-        for idx in sampled_indices:
-            data['context'].append(dataset['train']['post'][idx])
-            data['label'].append(dataset['train']['label'][idx])
-            data['label_text'].append(dataset['train']['label_text'][idx])
+        rows = take(dataset['train'], sampled_indices, ['post', 'label', 'label_text'])
+        data['context'].extend(rows['post'])
+        data['label'].extend(rows['label'])
+        data['label_text'].extend(rows['label_text'])
 
-        data['label_list'].extend([num_label_info] * max_rows)
+        data['label_list'].extend([num_label_info] * len(sampled_indices))
 
     elif dataset_name == "cssrs":
-        labels = dataset['train']['label']
-        sampled_indices = balanced_sampling(dataset['train'], labels, max_rows)
+        sampled_indices = balanced_sampling(dataset['train'], max_rows, seed=seed, replace=replace)
 
         num_label_info = {0: 'supportive', 1: 'indicator', 2: 'ideation', 3: 'behavior', 4: 'attempt'}
         num_label_info = list(num_label_info.values())
-        for idx in sampled_indices:
-            data['context'].append(dataset['train']['Post'][idx])
-            data['label'].append(dataset['train']['label'][idx])
-            data['label_text'].append(dataset['train']['label_text'][idx])
-        data['label_list'].extend([num_label_info] * max_rows)
+        rows = take(dataset['train'], sampled_indices, ['Post', 'label', 'label_text'])
+        data['context'].extend(rows['Post'])
+        data['label'].extend(rows['label'])
+        data['label_text'].extend(rows['label_text'])
+        data['label_list'].extend([num_label_info] * len(sampled_indices))
     elif dataset_name == "sdcnl":
-        labels = dataset['train']['label']
-        sampled_indices = balanced_sampling(dataset['train'], labels, max_rows)
+        sampled_indices = balanced_sampling(dataset['train'], max_rows, seed=seed, replace=replace)
 
         num_label_info = {0: 'depression', 1: 'suicidal'}
         num_label_info = list(num_label_info.values())
-
-        for idx in sampled_indices:
-            data['context'].append(dataset['train']['text'][idx])
-            data['label'].append(dataset['train']['label'][idx])
-            data['label_text'].append(dataset['train']['label_text'][idx])
-        data['label_list'].extend([num_label_info] * max_rows)
+        rows = take(dataset['train'], sampled_indices, ['text', 'label', 'label_text'])
+        data['context'].extend(rows['text'])
+        data['label'].extend(rows['label'])
+        data['label_text'].extend(rows['label_text'])
+        data['label_list'].extend([num_label_info] * len(sampled_indices))
     elif dataset_name == "goemotion":
-        labels = dataset['train']['label']
-        sampled_indices = balanced_sampling(dataset['train'], labels, max_rows)
+        sampled_indices = balanced_sampling(dataset['train'], max_rows, seed=seed, replace=replace)
 
         label_info = 'admiration, amusement, anger, annoyance, approval, caring, confusion, curiosity, desire, disappointment, disapproval, disgust, embarrassment, excitement, fear, gratitude, grief, joy, love, nervousness, optimism, pride, realization, relief, remorse, sadness, surpris, neutral'.replace(
             ' ', '')
         num_label_info = label_info.split(',')
 
-        for idx in sampled_indices:
-            data['context'].append(dataset['train']['sentence'][idx])
-            data['label'].append(dataset['train']['label'][idx])
-            data['label_text'].append(dataset['train']['label_text'][idx])
-        data['label_list'].extend([num_label_info] * max_rows)
+        rows = take(dataset['train'], sampled_indices, ['sentence', 'label', 'label_text'])
+        data['context'].extend(rows['sentence'])
+        data['label'].extend(rows['label'])
+        data['label_text'].extend(rows['label_text'])
+        data['label_list'].extend([num_label_info] * len(sampled_indices))
 
     return data
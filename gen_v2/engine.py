@@ -0,0 +1,49 @@
+import asyncio
+import time
+from tqdm import tqdm
+
+
+def _response_with_usage(model, query):
+    # Runs on an executor thread, so last_usage() sees this request's usage.
+    return model.response(query), model.last_usage()
+
+
+async def request(model, query):
+    # One request as (response, usage, latency in seconds): awaited directly for natively async
+    # models, otherwise run on the model's own executor.
+    start = time.perf_counter()
+    if model.native_async:
+        response = await model.async_response(query)
+        usage = model.last_usage()
+    else:
+        loop = asyncio.get_running_loop()
+        response, usage = await loop.run_in_executor(model.executor, _response_with_usage, model, query)
+    return response, usage, time.perf_counter() - start
+
+
+async def _run_requests(model, queries, on_result, concurrency, desc):
+    semaphore = asyncio.Semaphore(concurrency)
+    progress = tqdm(total=len(queries), desc=desc)
+
+    async def worker(key, query):
+        # Keep at most `concurrency` requests in flight; the rest wait here.
+        async with semaphore:
+            response, usage, latency = await request(model, query)
+        on_result(key, response, usage, latency)
+        progress.update(1)
+
+    await asyncio.gather(*(worker(key, query) for key, query in queries))
+
+    progress.close()
+
+
+# Send every (key, query) pair to the model with at most `concurrency` requests in flight (the
+# model's own concurrency by default), awaiting async_response directly for natively async models
+# and otherwise running model.response on the model's own long-lived executor.
+# on_result(key, response, usage, latency) runs on the event loop thread as each request completes;
+# usage is None when the answer came from the response cache.
+def run_requests(model, queries, on_result, concurrency=None, desc=None):
+    if concurrency is None:
+        concurrency = model.concurrency
+    concurrency = max(1, min(concurrency, len(queries) or 1))
+    asyncio.run(_run_requests(model, queries, on_result, concurrency, desc))
@@ -0,0 +1,169 @@
+import argparse
+import importlib
+import json
+import os
+import time
+from collections import defaultdict
+
+from gpt import model_class
+from sweep import SweepContext
+from systematic_evaluation import OUTPUT_BASE_DIR, config_prompts, parse_args, token_budget
+from tokens import counter_for
+
+# Pre-flight plan for a sweep: renders the prompts of every config of the given auto_run drivers
+# (through the prompt sets, so a later run reuses them), counts their tokens locally (see tokens.py)
+# and reports per model the requests, input/output tokens, cost at price_per_mtok and wall time at
+# the model's rpm/tpm quotas and concurrency. Prompts are fitted to each model's token budget as in
+# a run. Nothing is sent to a provider; with the datasets already snapshotted under ../cache/datasets
+# it runs offline.
+#   python estimate.py --driver Efficient_auto_run_GPT Efficient_auto_run_Gemini Efficient_auto_run_Seq
+
+# Output tokens per request when no earlier run of the model has recorded any.
+DEFAULT_OUTPUT_TOKENS = {'Classification': 30, 'Reasoning': 200}
+
+
+def observed_output_tokens(results_dir):
+    # Mean output tokens per (model, problem_task) from the usage.jsonl files of earlier runs.
+    totals = defaultdict(lambda: [0, 0])
+    for root, _, files in os.walk(results_dir):
+        if 'usage.jsonl' not in files:
+            continue
+        parts = os.path.relpath(root, results_dir).split(os.sep)
+        if len(parts) < 3:
+            continue
+        total = totals[(parts[-1], parts[1])]
+        with open(os.path.join(root, 'usage.jsonl'), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    output_tokens = json.loads(line).get('output_tokens')
+                except json.JSONDecodeError:
+                    continue
+                if output_tokens:
+                    total[0] += output_tokens
+                    total[1] += 1
+    return {key: tokens / count for key, (tokens, count) in totals.items() if count}
+
+
+def output_cap(cls):
+    params = dict(cls.generation_params)
+    return params.get('max_tokens') or params.get('num_predict') or params.get('max_new_tokens')
+
+
+class ModelPlan:
+    def __init__(self, model_name, args):
+        self.model_name = model_name
+        self.cls = model_class(model_name)
+        self.counter = counter_for(self.cls)
+        self.rpm = args.rpm or self.cls.rpm
+        self.tpm = args.tpm or self.cls.tpm
+        self.concurrency = args.concurrency or self.cls.concurrency
+        self.configs = 0
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def add(self, input_counts, output_tokens):
+        self.configs += 1
+        self.requests += len(input_counts)
+        self.input_tokens += sum(input_counts)
+        self.output_tokens += round(output_tokens * len(input_counts))
+
+    def cost(self):
+        if self.cls.price_per_mtok is None:
+            return 0.0
+        input_price, output_price = self.cls.price_per_mtok
+        return (self.input_tokens * input_price + self.output_tokens * output_price) / 1e6
+
+    def wall_seconds(self, latency):
+        # The slower of the provider quota and the requests in flight at the observed latency.
+        limits = [self.requests * latency / max(1, self.concurrency)]
+        if self.rpm:
+            limits.append(self.requests / self.rpm * 60)
+        if self.tpm:
+            limits.append((self.input_tokens + self.output_tokens) / self.tpm * 60)
+        return max(limits)
+
+
+def format_seconds(seconds):
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}h{rest // 60:02d}m" if hours else f"{rest // 60}m{rest % 60:02d}s"
+
+
+def plan_sweep(configs, results_dir=OUTPUT_BASE_DIR, output_tokens=None):
+    # configs: [(model_name, args)]. Returns {model_name: ModelPlan}.
+    observed = observed_output_tokens(results_dir) if os.path.isdir(results_dir) else {}
+    context = SweepContext()
+    plans = {}
+    counts = {}
+    configs = sorted(configs, key=lambda item: (item[1].data, item[1].dataset_revision, item[1].max_rows))
+    for model_name, args in configs:
+        plan = plans.get(model_name)
+        if plan is None:
+            plan = plans[model_name] = ModelPlan(model_name, args)
+        dataset = context.dataset(args)
+        prompter = context.prompter(args)
+        prompts, _ = config_prompts(args, dataset, prompter, plan.cls, context=context)
+
+        # Models with the same tokenizer and token budget count a prompt set once.
+        key = (prompts.key, plan.counter.name, token_budget(args, plan.cls))
+        if key not in counts:
+            counts[key] = plan.counter.count_prompts([(prompt['system'], prompt['user']) for prompt in prompts])
+
+        if args.scoring == 'loglik':
+            expected_output = 0
+        else:
+            expected_output = (output_tokens or observed.get((model_name, args.problem_task))
+                               or DEFAULT_OUTPUT_TOKENS.get(args.problem_task, 30))
+            cap = output_cap(plan.cls)
+            if cap:
+                expected_output = min(expected_output, cap)
+        plan.add(counts[key], expected_output)
+    return plans
+
+
+def report(plans, latency):
+    lines = [f"{'model':<16} {'configs':>7} {'requests':>9} {'input tok':>12} {'output tok':>11} {'cost $':>9} "
+             f"{'wall':>8}  tokenizer"]
+    for plan in plans.values():
+        lines.append(f"{plan.model_name:<16} {plan.configs:>7} {plan.requests:>9} {plan.input_tokens:>12,} "
+                     f"{plan.output_tokens:>11,} {plan.cost():>9.2f} {format_seconds(plan.wall_seconds(latency)):>8}  "
+                     f"{plan.counter.name}")
+    walls = [plan.wall_seconds(latency) for plan in plans.values()]
+    lines.append(f"{'total':<16} {sum(p.configs for p in plans.values()):>7} "
+                 f"{sum(p.requests for p in plans.values()):>9} {sum(p.input_tokens for p in plans.values()):>12,} "
+                 f"{sum(p.output_tokens for p in plans.values()):>11,} {sum(p.cost() for p in plans.values()):>9.2f}")
+    estimated = [plan.model_name for plan in plans.values() if plan.counter.name.startswith('~')]
+    if estimated:
+        # counter_for falls back to a chars-per-token ratio when the model's tokenizer is not available.
+        lines.append(f"Input tokens of {', '.join(estimated)} are estimated from characters; install tiktoken "
+                     f"(GPT) or cache the model's tokenizer (transformers) to count them exactly.")
+    if walls:
+        lines.append(f"Wall time: {format_seconds(max(walls))} with providers in parallel (scheduler.py), "
+                     f"{format_seconds(sum(walls))} one model after another.")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Estimate the tokens, cost and wall time of a sweep before running it')
+    parser.add_argument('--driver', type=str, nargs='+', required=True,
+                        help='Driver modules providing model_parameters and generate_commands()')
+    parser.add_argument('--max_rows', type=int, required=False, default=200)
+    parser.add_argument('--results', type=str, required=False, default=OUTPUT_BASE_DIR,
+                        help='Earlier results whose usage.jsonl gives the expected output tokens per model')
+    parser.add_argument('--output_tokens', type=int, required=False, default=None,
+                        help='Expected output tokens per request, instead of the observed or default ones')
+    parser.add_argument('--latency', type=float, required=False, default=2.0,
+                        help='Seconds per request, for models limited by concurrency rather than quota')
+    args, base_args = parser.parse_known_args()
+
+    start = time.time()
+    configs = []
+    for driver_name in args.driver:
+        driver = importlib.import_module(driver_name)
+        for model_name in driver.model_parameters:
+            for command in driver.generate_commands(max_rows=args.max_rows):
+                configs.append((model_name, parse_args(['--models', model_name] + base_args + command)))
+
+    plans = plan_sweep(configs, results_dir=args.results, output_tokens=args.output_tokens)
+    print(report(plans, args.latency))
+    print(f"Planned {len(configs)} configs in {time.time() - start:.1f}s")
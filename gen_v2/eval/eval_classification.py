@@ -1,4 +1,5 @@
 import os
+import sys
 import argparse
 from sklearn.metrics import f1_score, accuracy_score, precision_score, recall_score, confusion_matrix, classification_report
 from tqdm import tqdm
@@ -6,6 +7,9 @@ import re
 import numpy as np
 from scipy.stats import pearsonr
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from result_store import answer_text, has_results, read_results
+
 def parse_text(input_text, file_path, error_files):
     parsed_data = {}
 
@@ -62,6 +66,14 @@ def process_result_files(folder_path):
     result_files = [file for file in all_files if 'answer' in file and file.endswith('.txt')]
     return result_files
 
+def load_answers(folder_path, error_files):
+    # (name, parsed answer) per sample, from results.jsonl when the run wrote one, else from the answer .txt files.
+    if has_results(folder_path):
+        return [(f"answer{record['index']}", parse_text(answer_text(record), f"answer{record['index']}", error_files))
+                for record in read_results(folder_path, queries=False)]
+    return [(answer_path, parser_txt(os.path.join(folder_path, answer_path), error_files))
+            for answer_path in process_result_files(folder_path)]
+
 def calculate_correlations(confidence_scores, accuracies):
     accuracy_corr, _ = pearsonr(confidence_scores, accuracies)
     return accuracy_corr
@@ -123,10 +135,9 @@ def main(args):
         failed_count = 0
         error_files = []
         folder_path = os.path.join(path, model)
-        files = process_result_files(folder_path)
+        answers = load_answers(folder_path, error_files)
 
-        for answer_path in tqdm(files, desc=f"Processing {model} files"):
-            labels = parser_txt(os.path.join(folder_path, answer_path), error_files)
+        for answer_path, labels in tqdm(answers, desc=f"Processing {model} files"):
             if labels is not None:
                 try:
                     label = labels['Label']
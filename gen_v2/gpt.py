@@ -1,19 +1,103 @@
-from ollama import Client
+from cache import ResponseCache
+from rate_limit import RateLimiter, backoff_delay, is_rate_limit_error, retry_after_seconds
+import asyncio
 import json
+import os
 import time
-import openai
-import anthropic
-import google.generativeai as genai
 import concurrent.futures
-import transformers
-import torch
+import contextvars
+import threading
+
+# Provider SDKs (openai, anthropic, google.generativeai, ollama, transformers/torch) are imported
+# inside the model classes, so a run only pays the import time of the provider it uses.
+
+
+FAILED_RESPONSE = "Failed to get a response"
+# Everything in the user prompt before this marker (few-shot block and prompt strategy) is the
+# same for every sample of a config; only the input and what follows it change per row.
+INPUT_MARKER = '###Input###'
+
+# Token usage of the last request made by the current thread / asyncio task.
+_last_usage = contextvars.ContextVar('last_usage', default=None)
 
 
 class BaseModel:
+    # Number of requests systematic_evaluation keeps in flight for this model class.
+    concurrency = 1
+    # True when the class implements async_response natively instead of going through the executor.
+    native_async = False
+    # True when the class can pick a label by log-likelihood (--scoring loglik) instead of generating text.
+    supports_scoring = False
+    # HTTP-level timeout (seconds) for a single request, and attempts per prompt.
+    timeout = 10
+    retries = 5
+    # Provider quota shared by every process of a sweep; None means unlimited.
+    rpm = None
+    tpm = None
+    # Identify the generation for the response cache; subclasses set the real values.
+    model_id = None
+    generation_params = {}
+    # USD per million (input, output) tokens, used by estimate.py; None for models run locally.
+    price_per_mtok = None
+    # Prompt tokens a prompt is fitted to by default (see --token_budget); None leaves prompts whole.
+    context_budget = None
+
     def __init__(self, api_key, args):
         self.api_key = api_key
         self.args = args
         self.general_prompts = self.extract_prompt_template()
+        self.cache = None
+        self.rate_limiter = None
+        self._configure_services(args)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self.usage_totals = {'requests': 0, 'input_tokens': 0, 'cached_input_tokens': 0, 'output_tokens': 0}
+        self._usage_lock = threading.Lock()
+
+    @property
+    def executor(self):
+        # One bounded pool per model, shared by every request it serves.
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency,
+                                                                       thread_name_prefix=type(self).__name__)
+            return self._executor
+
+    def close(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def configure(self, args):
+        # Re-point an already loaded model at another config of a sweep (see worker.py).
+        self.args = args
+        self.general_prompts = self.extract_prompt_template()
+        self._configure_services(args)
+        # --concurrency holds for its config only; the pool is rebuilt at the next config's size.
+        concurrency = getattr(args, 'concurrency', None) or type(self).concurrency
+        if concurrency != self.concurrency:
+            self.close()
+            self.concurrency = concurrency
+
+    def _configure_services(self, args):
+        # The response cache and rate limiter of a config (--cache, --no_cache, --rpm, --tpm,
+        # --rate_limits); those already open are kept while the next config asks for the same.
+        cache_path = getattr(args, 'cache', None)
+        max_bytes = getattr(args, 'cache_max_mb', 1024) * 1024 * 1024
+        if not cache_path:
+            self.cache = None
+        elif self.cache is None or (self.cache.path, self.cache.max_bytes) != (cache_path, max_bytes):
+            self.cache = ResponseCache(cache_path, max_bytes=max_bytes)
+
+        rpm = getattr(args, 'rpm', None) or self.rpm
+        tpm = getattr(args, 'tpm', None) or self.tpm
+        limits_path = getattr(args, 'rate_limits', None)
+        limiter = self.rate_limiter
+        if not limits_path or not (rpm or tpm):
+            self.rate_limiter = None
+        elif limiter is None or (limiter.rpm, limiter.tpm, limiter.path) != (rpm, tpm, limits_path):
+            self.rate_limiter = RateLimiter(type(self).__name__, rpm=rpm, tpm=tpm, path=limits_path)
 
     def extract_prompt_template(self):
         general_prompts = json.load(open('../prompt_template_v2/classification_general_prompt.json', 'r'))
@@ -24,6 +108,9 @@ class BaseModel:
         return general_prompts
 
     def split_prompt(self, prompt: dict, mode='basic'):
+        if mode == 'basic' and 'system' in prompt and 'user' in prompt:
+            # Already rendered for its config, e.g. read from a prompt set (see prompt_set.py).
+            return prompt['system'], prompt['user']
         if mode == 'basic':
             system_prompt = self.general_prompts['system'].format(system_instruction=prompt['system_instruction'],
                                                                   task_query=prompt['task_query'])
@@ -38,91 +125,175 @@ class BaseModel:
 
         return system_prompt, user_prompt
 
+    @staticmethod
+    def split_cacheable(user_prompt):
+        # (stable prefix, per-sample suffix) of a user prompt; prefix + suffix == user_prompt.
+        marker = user_prompt.find(INPUT_MARKER)
+        if marker <= 0:
+            return '', user_prompt
+        return user_prompt[:marker], user_prompt[marker:]
+
     def response(self, prompt: dict):
         system_prompt, user_prompt = self.split_prompt(prompt, mode='basic')
-        return system_prompt, user_prompt
+        return system_prompt + user_prompt, self.generate(system_prompt, user_prompt)
+
+    def generate(self, system_prompt, user_prompt):
+        _last_usage.set(None)
+        key, cached = self._cache_lookup(system_prompt, user_prompt)
+        if cached is not None:
+            return cached
+
+        response = self._response_with_retries(system_prompt, user_prompt, self.timeout, self.retries)
+        self._cache_store(key, response)
+        return response
+
+    def _cache_lookup(self, system_prompt, user_prompt):
+        if self.cache is None:
+            return None, None
+        key = self.cache.make_key(self.model_id, system_prompt, user_prompt, self.generation_params)
+        return key, self.cache.get(key)
+
+    def _cache_store(self, key, response):
+        if key is not None and response != FAILED_RESPONSE:
+            self.cache.put(key, response)
+
+    def timing_report(self):
+        return None
+
+    def _response_with_retries(self, system_prompt, user_prompt, timeout, retries):
+        # The timeout is enforced by the HTTP client inside _get_response, so a timed-out
+        # request is abandoned instead of leaving a worker thread blocked behind us.
+        for attempt in range(retries):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(self.estimate_tokens(system_prompt, user_prompt))
 
+            retry_after = None
+            try:
+                response = self._get_response(system_prompt, user_prompt, timeout)
+                if response:
+                    return response
+                print(f"Attempt {attempt + 1}: No response. Retrying...")
+            except Exception as e:
+                print(f"Attempt {attempt + 1}: Error during {type(self).__name__} response: {e}")
+                if is_rate_limit_error(e):
+                    retry_after = retry_after_seconds(e)
+                    if retry_after is not None and self.rate_limiter is not None:
+                        self.rate_limiter.penalize(retry_after)
 
-class GPT(BaseModel):
-    def __init__(self, api_key, args):
-        super().__init__(api_key, args)
-        self.client = openai.OpenAI(api_key=self.api_key)
+            if attempt + 1 < retries:
+                time.sleep(backoff_delay(attempt, retry_after))
 
-    def _get_response(self, system_prompt, user_prompt):
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-2024-05-13",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                temperature=0.0,
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"Error during GPT response: {e}")
-            return None
+        return FAILED_RESPONSE
 
-    def response(self, text: dict, timeout=10, retries=5):
-        system_prompt, user_prompt = super().response(text)
+    def _record_usage(self, input_tokens, cached_input_tokens=0, output_tokens=0):
+        # input_tokens counts the whole prompt; cached_input_tokens is the part served from the provider's cache.
+        usage = {'input_tokens': input_tokens or 0, 'cached_input_tokens': cached_input_tokens or 0,
+                 'output_tokens': output_tokens or 0}
+        _last_usage.set(usage)
+        with self._usage_lock:
+            self.usage_totals['requests'] += 1
+            for key, value in usage.items():
+                self.usage_totals[key] += value
 
-        for attempt in range(retries):
-            try:
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(self._get_response, system_prompt, user_prompt)
-                    response = future.result(timeout=timeout)
-                    if response:
-                        return system_prompt + user_prompt, response
-            except concurrent.futures.TimeoutError:
-                print(f"Attempt {attempt + 1}: Timeout. Retrying...")
-            except Exception as e:
-                print(f"An error occurred: {e}")
+    def last_usage(self):
+        return _last_usage.get()
 
-        return system_prompt + user_prompt, "Failed to get a response"
+    def usage_report(self):
+        totals = self.usage_totals
+        cached_share = totals['cached_input_tokens'] / totals['input_tokens'] if totals['input_tokens'] else 0.0
+        return (f"Token usage: {totals['requests']} requests, {totals['input_tokens']} input tokens "
+                f"({totals['cached_input_tokens']} cached, {cached_share:.1%}), {totals['output_tokens']} output tokens")
 
+    def estimate_tokens(self, system_prompt, user_prompt):
+        # Rough count (~4 characters per token) used to charge the tokens/min bucket.
+        return (len(system_prompt) + len(user_prompt)) // 4
+
+
+class GPT(BaseModel):
+    concurrency = 16
+    rpm = 500
+    tpm = 30000
+    model_id = "gpt-4o-2024-05-13"
+    generation_params = {"temperature": 0.0}
+    price_per_mtok = (5.00, 15.00)
 
-class Claude(BaseModel):
     def __init__(self, api_key, args):
         super().__init__(api_key, args)
-        self.client = anthropic.Anthropic(api_key=self.api_key)
+        import openai
+        self.client = openai.OpenAI(api_key=self.api_key, base_url=getattr(args, 'base_url', None),
+                                    timeout=self.timeout, max_retries=0)
+
+    def _get_response(self, system_prompt, user_prompt, timeout):
+        response = self.client.chat.completions.create(
+            model=self.model_id,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            timeout=timeout,
+            **self.generation_params,
+        )
+        # The system prompt and few-shot prefix come first and never change within a config,
+        # which is what OpenAI's automatic prompt caching keys on.
+        details = getattr(response.usage, 'prompt_tokens_details', None)
+        self._record_usage(response.usage.prompt_tokens, getattr(details, 'cached_tokens', 0),
+                           response.usage.completion_tokens)
+        return response.choices[0].message.content
 
-    def _get_response(self, system_prompt, user_prompt):
-        try:
-            response = self.client.messages.create(
-                model="claude-3-5-sonnet-20240620",
-                temperature=0.0,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": user_prompt},
-                ],
-                max_tokens=1000,
-            )
-            return response.content[0].text
-        except Exception as e:
-            print(f"Error during Claude response: {e}")
-            return None
 
-    def response(self, text: dict, timeout=10, retries=5):
-        system_prompt, user_prompt = super().response(text)
+class Claude(BaseModel):
+    concurrency = 8
+    rpm = 50
+    tpm = 40000
+    model_id = "claude-3-5-sonnet-20240620"
+    generation_params = {"temperature": 0.0, "max_tokens": 1000}
+    price_per_mtok = (3.00, 15.00)
 
-        for attempt in range(retries):
-            try:
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(self._get_response, system_prompt, user_prompt)
-                    response = future.result(timeout=timeout)
-                    if response:
-                        return system_prompt + user_prompt, response
-            except concurrent.futures.TimeoutError:
-                print(f"Attempt {attempt + 1}: Timeout. Retrying...")
-            except Exception as e:
-                print(f"An error occurred: {e}")
+    def __init__(self, api_key, args):
+        super().__init__(api_key, args)
+        import anthropic
+        self.client = anthropic.Anthropic(api_key=self.api_key, base_url=getattr(args, 'base_url', None),
+                                          timeout=self.timeout, max_retries=0)
+
+    def user_content(self, user_prompt):
+        # Put a cache breakpoint after the stable prefix so the system prompt and few-shot block
+        # are read from Anthropic's prompt cache for every sample after the first.
+        prefix, suffix = self.split_cacheable(user_prompt)
+        if not prefix:
+            return user_prompt
+        return [
+            {"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": suffix},
+        ]
 
-        return system_prompt + user_prompt, "Failed to get a response"
+    def _get_response(self, system_prompt, user_prompt, timeout):
+        response = self.client.messages.create(
+            model=self.model_id,
+            system=system_prompt,
+            messages=[
+                {"role": "user", "content": self.user_content(user_prompt)},
+            ],
+            timeout=timeout,
+            **self.generation_params,
+        )
+        usage = response.usage
+        cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+        cache_write = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+        self._record_usage(usage.input_tokens + cache_read + cache_write, cache_read, usage.output_tokens)
+        return response.content[0].text
 
 
 class Gemini(BaseModel):
+    concurrency = 4
+    rpm = 1000
+    tpm = 4000000
+    model_id = "gemini-1.5-pro"
+    # Prompts up to 128k tokens.
+    price_per_mtok = (3.50, 10.50)
+
     def __init__(self, api_key, args):
         super().__init__(api_key, args)
+        import google.generativeai as genai
         genai.configure(api_key=self.api_key)
         self.generation_config = {
             "candidate_count": 1,
@@ -153,13 +324,19 @@ class Gemini(BaseModel):
             },
         ]
         self.client = genai.GenerativeModel(
-            model_name="gemini-1.5-pro",
+            model_name=self.model_id,
             safety_settings=self.safety_settings
         )
 
-    def _get_response(self, system_prompt, user_prompt):
+    def _get_response(self, system_prompt, user_prompt, timeout):
+        import google.generativeai as genai
         try:
-            response = self.client.generate_content(system_prompt + user_prompt)
+            response = self.client.generate_content(system_prompt + user_prompt,
+                                                    request_options={"timeout": timeout})
+            usage = getattr(response, 'usage_metadata', None)
+            if usage is not None:
+                self._record_usage(usage.prompt_token_count, getattr(usage, 'cached_content_token_count', 0),
+                                   usage.candidates_token_count)
             return response.text
         except genai.types.generation_types.BlockedPromptException as e:
             print(f"Prompt blocked due to: {e}")
@@ -167,133 +344,358 @@ class Gemini(BaseModel):
         except ValueError as e:
             print(f"ValueError encountered: {e}")
             return None
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            return None
-        finally:
-            time.sleep(0.25)
 
-    def response(self, text: dict, timeout=10, retries=5):
-        system_prompt, user_prompt = super().response(text)
 
-        for attempt in range(retries):
-            try:
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(self._get_response, system_prompt, user_prompt)
-                    response = future.result(timeout=timeout)
-                    if response:
-                        return system_prompt + user_prompt, response
-            except concurrent.futures.TimeoutError:
-                print(f"Attempt {attempt + 1}: Timeout. Retrying...")
-            except Exception as e:
-                print(f"An error occurred: {e}")
+def label_candidates(label_list):
+    # iemocap keeps its labels as {index: name}; the other datasets use a plain list.
+    if isinstance(label_list, dict):
+        label_list = list(label_list.values())
+    candidates = []
+    for label in label_list:
+        label = str(label).strip()
+        if label and label not in candidates:
+            candidates.append(label)
+    return candidates
 
-        return system_prompt + user_prompt, "Failed to get a response"
 
+class TransformersBase(BaseModel):
+    supports_scoring = True
+    retries = 1
+    generation_params = {"max_new_tokens": 512, "top_p": 0.9, "temperature": 0.1}
+    # Prompts per generate() call in batch_response.
+    batch_size = 8
+    # Models whose chat template has no system role get the system prompt prepended to the user turn.
+    merge_system = False
 
-class Llama(BaseModel):
     def __init__(self, api_key, args):
         super().__init__(api_key, args)
-        model_id = "alokabhishek/Meta-Llama-3-8B-Instruct-bnb-8bit"
+        self.model_id = getattr(args, 'hf_model_id', None) or self.model_id
+        self.batch_size = getattr(args, 'gen_batch_size', None) or self.batch_size
+        self.scoring = getattr(args, 'scoring', None) or 'generate'
+        import torch
+        import transformers
         self.pipeline = transformers.pipeline(
             "text-generation",
-            model=model_id,
-            model_kwargs={"torch_dtype": torch.float16},
+            model=self.model_id,
+            model_kwargs={"torch_dtype": torch.float16 if torch.cuda.is_available() else torch.float32},
             device_map="auto",
         )
 
-    def _get_response(self, system_prompt, user_prompt):
-        inputs = [
+    def configure(self, args):
+        super().configure(args)
+        self.batch_size = getattr(args, 'gen_batch_size', None) or type(self).batch_size
+        self.scoring = getattr(args, 'scoring', None) or 'generate'
+
+    def _messages(self, system_prompt, user_prompt):
+        if self.merge_system:
+            return [{"role": "user", "content": system_prompt + user_prompt}]
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ]
-        response = self.pipeline(inputs, max_new_tokens=512, top_p=0.9, temperature=0.1)
+
+    def _get_response(self, system_prompt, user_prompt, timeout):
+        response = self.pipeline(self._messages(system_prompt, user_prompt), **self.generation_params)
         return response[0]["generated_text"][-1]['content']
 
-    def response(self, text: dict):
-        system_prompt, user_prompt = super().response(text)
-        response = self._get_response(system_prompt, user_prompt)
-        return system_prompt + user_prompt, response
+    def response(self, prompt: dict):
+        if self.scoring != 'loglik':
+            return super().response(prompt)
+        system_prompt, user_prompt = self.split_prompt(prompt, mode='basic')
+        _last_usage.set(None)
+        answer = self.score_labels(system_prompt, user_prompt, label_candidates(prompt['label_list']))
+        return system_prompt + user_prompt, answer
+
+    def score_labels(self, system_prompt, user_prompt, labels):
+        # Score every candidate as the continuation of "<prompt>Label:" and answer in the same
+        # "Label: ... Confidence Score: ..." format the generated answers use, so eval_classification
+        # parses it unchanged. Labels are ranked by their length-normalised log-likelihood, the mean
+        # log-probability per label token, so labels of more tokens are not penalised for their length;
+        # the confidence is the softmax of those means over the candidate set.
+        import torch
+        tokenizer = self.pipeline.tokenizer
+        model = self.pipeline.model
+        prefix = self._render(system_prompt, user_prompt) + 'Label:'
+        prefix_ids = tokenizer(prefix, return_tensors='pt',
+                               add_special_tokens=not tokenizer.chat_template)['input_ids'].to(model.device)
+
+        label_ids = [tokenizer(' ' + label, add_special_tokens=False)['input_ids'] for label in labels]
+        with torch.no_grad():
+            # One forward pass over the shared prefix; its KV cache is reused for every label.
+            cache = self._prefix_cache(model, prefix_ids.shape[1] + max(len(ids) for ids in label_ids))
+            outputs = model(prefix_ids, past_key_values=cache, use_cache=True)
+            first_logprobs = torch.log_softmax(outputs.logits[0, -1].float(), dim=-1)
+            past = outputs.past_key_values
+            if hasattr(past, 'to_legacy_cache'):
+                past = past.to_legacy_cache()
+
+            scores = []
+            for ids in label_ids:
+                score = first_logprobs[ids[0]].item()
+                if len(ids) > 1:
+                    score += self._continuation_logprob(model, prefix_ids, past, ids)
+                scores.append(score / len(ids))
+
+        probs = torch.softmax(torch.tensor(scores), dim=0)
+        best = int(torch.argmax(probs))
+        self._record_usage(prefix_ids.shape[1], 0, 0)
+        return f"Label: {labels[best]}\nConfidence Score: {probs[best].item():.4f}"
+
+    @staticmethod
+    def _prefix_cache(model, length):
+        # Architectures with a fixed-size cache (Gemma 2's hybrid sliding-window cache) return none
+        # unless it is allocated up front, here long enough for the prefix and the longest label.
+        # Past the sliding window the rolled cache scores multi-token labels differently from a full
+        # pass, so such prompts keep re-running the prefix.
+        import transformers
+        cache_class = {'hybrid': transformers.HybridCache, 'static': transformers.StaticCache}.get(
+            getattr(model.config, 'cache_implementation', None))
+        if cache_class is None or length > (getattr(model.config, 'sliding_window', None) or length):
+            return None
+        return cache_class(model.config, max_batch_size=1, max_cache_len=length, device=model.device,
+                           dtype=model.dtype)
+
+    def _continuation_logprob(self, model, prefix_ids, past, label_ids):
+        # Log-probability of label_ids[1:] given the prefix and label_ids[0].
+        import copy
+        import torch
+        import transformers
+        inputs = torch.tensor([label_ids[:-1]], device=prefix_ids.device)
+        if isinstance(past, tuple):
+            # Legacy tuples are wrapped in a fresh cache object per call, so the prefix cache is never mutated.
+            cache = transformers.DynamicCache.from_legacy_cache(past)
+            logits = model(inputs, past_key_values=cache, use_cache=True).logits[0]
+        elif past is not None:
+            # The model's own cache type is copied per label; fixed-size caches need the positions spelled out.
+            cache_position = torch.arange(prefix_ids.shape[1], prefix_ids.shape[1] + inputs.shape[1],
+                                          device=prefix_ids.device)
+            logits = model(inputs, past_key_values=copy.deepcopy(past), cache_position=cache_position,
+                           use_cache=True).logits[0]
+        else:
+            # Models returning no cache at all re-run the prefix.
+            logits = model(torch.cat([prefix_ids, inputs], dim=1)).logits[0, prefix_ids.shape[1]:]
+        logprobs = torch.log_softmax(logits.float(), dim=-1)
+        return sum(logprobs[i, label_ids[i + 1]].item() for i in range(len(label_ids) - 1))
+
+    def _render(self, system_prompt, user_prompt):
+        tokenizer = self.pipeline.tokenizer
+        messages = self._messages(system_prompt, user_prompt)
+        if tokenizer.chat_template:
+            return tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        # Small test models ship without a chat template.
+        return '\n\n'.join(message['content'] for message in messages) + '\n\n'
+
+    def batch_response(self, queries):
+        # Generate answers for (key, query) pairs in batches of prompts with similar token length,
+        # so little compute is wasted on padding. Yields (key, (query_text, answer), usage) in the
+        # original order of `queries`, each one as soon as it and everything before it is done.
+        if self.scoring == 'loglik':
+            for key, query in queries:
+                yield key, self.response(query), self.last_usage()
+            return
+
+        tokenizer = self.pipeline.tokenizer
+        ready = {}
+        pending = []
+        for position, (key, query) in enumerate(queries):
+            system_prompt, user_prompt = self.split_prompt(query, mode='basic')
+            cache_key, cached = self._cache_lookup(system_prompt, user_prompt)
+            if cached is not None:
+                ready[position] = (key, (system_prompt + user_prompt, cached), None)
+                continue
+            text = self._render(system_prompt, user_prompt)
+            length = len(tokenizer(text, add_special_tokens=False)['input_ids'])
+            pending.append((length, position, key, cache_key, system_prompt + user_prompt, text))
+
+        pending.sort(key=lambda item: item[0])
+        next_position = 0
+        for start in range(0, len(pending), self.batch_size):
+            bucket = pending[start:start + self.batch_size]
+            try:
+                answers = self._generate_batch([item[5] for item in bucket])
+            except Exception as e:
+                # A failed bucket (e.g. out of GPU memory on its longest prompts) costs only its own rows:
+                # they are retried one at a time, and those failing again are answered FAILED_RESPONSE.
+                print(f"Batch of {len(bucket)} prompts failed ({type(e).__name__}: {e}); retrying them one by one.")
+                answers = [self._generate_one(item[5]) for item in bucket]
+            for (length, position, key, cache_key, query_text, _), (answer, output_tokens) in zip(bucket, answers):
+                if answer == FAILED_RESPONSE:
+                    ready[position] = (key, (query_text, answer), None)
+                    continue
+                self._record_usage(length, 0, output_tokens)
+                self._cache_store(cache_key, answer)
+                ready[position] = (key, (query_text, answer), self.last_usage())
+
+            while next_position in ready:
+                yield ready.pop(next_position)
+                next_position += 1
+
+        while next_position in ready:
+            yield ready.pop(next_position)
+            next_position += 1
+
+    def _generate_one(self, text):
+        import torch
+        if torch.cuda.is_available():
+            # Hand back whatever the failed batch left allocated.
+            torch.cuda.empty_cache()
+        try:
+            return self._generate_batch([text])[0]
+        except Exception as e:
+            print(f"Error during {type(self).__name__} response: {e}")
+            return FAILED_RESPONSE, 0
 
+    def _generate_batch(self, texts):
+        import torch
+        tokenizer = self.pipeline.tokenizer
+        model = self.pipeline.model
+        # Decoder-only models continue from the last position, so pad on the left.
+        tokenizer.padding_side = 'left'
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
 
-class Qwen(BaseModel):
-    def __init__(self, api_key, args):
-        super().__init__(api_key, args)
-        model_id = "Qwen/Qwen2-7B-Instruct"
-        self.pipeline = transformers.pipeline(
-            "text-generation",
-            model=model_id,
-            model_kwargs={"torch_dtype": torch.float16},
-            device_map="auto",
-        )
+        inputs = tokenizer(texts, return_tensors='pt', padding=True,
+                           add_special_tokens=not tokenizer.chat_template).to(model.device)
+        with torch.no_grad():
+            outputs = model.generate(**inputs, pad_token_id=tokenizer.pad_token_id, **self.generation_params)
 
-    def _get_response(self, system_prompt, user_prompt):
-        inputs = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
-        response = self.pipeline(inputs, max_new_tokens=512, top_p=0.9, temperature=0.1)
-        return response[0]["generated_text"][-1]['content']
+        new_tokens = outputs[:, inputs['input_ids'].shape[1]:]
+        answers = tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+        output_tokens = (new_tokens != tokenizer.pad_token_id).sum(dim=1).tolist()
+        return list(zip(answers, output_tokens))
 
-    def response(self, text: dict):
-        system_prompt, user_prompt = super().response(text)
-        response = self._get_response(system_prompt, user_prompt)
-        return system_prompt + user_prompt, response
 
+class Llama(TransformersBase):
+    model_id = "alokabhishek/Meta-Llama-3-8B-Instruct-bnb-8bit"
 
-class Gemma(BaseModel):
-    def __init__(self, api_key, args):
-        super().__init__(api_key, args)
-        model_id = "google/gemma-2-9b-it"
-        self.pipeline = transformers.pipeline(
-            "text-generation",
-            model=model_id,
-            model_kwargs={"torch_dtype": torch.float16},
-            device_map="auto",
-        )
 
-    def _get_response(self, system_prompt, user_prompt):
-        inputs = [
-            {"role": "user", "content": system_prompt + user_prompt},
-        ]
-        response = self.pipeline(inputs, max_new_tokens=512, top_p=0.9, temperature=0.1)
-        return response[0]["generated_text"][-1]['content']
+class Qwen(TransformersBase):
+    model_id = "Qwen/Qwen2-7B-Instruct"
 
-    def response(self, text: dict):
-        system_prompt, user_prompt = super().response(text)
-        response = self._get_response(system_prompt, user_prompt)
-        return system_prompt + user_prompt, response
+
+class Gemma(TransformersBase):
+    model_id = "google/gemma-2-9b-it"
+    merge_system = True
 
 
 # Ollama 모델 추가
 class OllamaBase(BaseModel):
+    # Ollama serves this many requests per loaded model at once; more would only queue on the server.
+    concurrency = int(os.environ.get('OLLAMA_NUM_PARALLEL', 4))
+    native_async = True
+    # Local generation can be slow, especially while the model is still loading.
+    timeout = 600
+    retries = 1
+    generation_params = {"temperature": 0.0, "num_predict": 128}
+    # Ollama's default context is 2048 tokens, less num_predict for the answer. Longer prompts would be
+    # cut by the server anyway, and prompt evaluation dominates the latency of local models.
+    context_budget = 1920
+    # Keep the model and its KV cache resident between requests (and between the per-config
+    # subprocesses of a sweep) so the shared prompt prefix is reused instead of re-evaluated.
+    keep_alive = '30m'
+
     def __init__(self, api_key, args, model_name):
         super().__init__(api_key, args)
-        self.client = Client(host='http://localhost:11434')
+        self.host = 'http://localhost:11434'
+        from ollama import Client
+        self.client = Client(host=self.host)
         self.model_name = model_name
+        self.model_id = model_name
+        self.keep_alive = getattr(args, 'keep_alive', None) or self.keep_alive
+        self._async_client = None
+        self._async_loop = None
+        self.timing = {'requests': 0, 'load': 0.0, 'prompt_eval': 0.0, 'eval': 0.0, 'total': 0.0}
+        self._timing_lock = threading.Lock()
+
+    def configure(self, args):
+        super().configure(args)
+        self.keep_alive = getattr(args, 'keep_alive', None) or type(self).keep_alive
+
+    def _messages(self, system_prompt, user_prompt):
+        return [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': user_prompt},
+        ]
 
-    def _get_response(self, system_prompt, user_prompt):
+    def warm_up(self):
+        # An empty generate call only loads the model; pin it for keep_alive before the first real request.
+        try:
+            response = self.client.generate(model=self.model_name, prompt='', keep_alive=self.keep_alive)
+        except Exception as e:
+            print(f"Error while loading Ollama model {self.model_name}: {e}")
+            return
+        load_seconds = response.get('load_duration', 0) / 1e9
+        with self._timing_lock:
+            self.timing['load'] += load_seconds
+        print(f"Ollama model {self.model_name} ready (load {load_seconds:.1f}s, keep_alive={self.keep_alive})")
+
+    def _record_ollama(self, response):
+        # Ollama only reports the prompt tokens it had to evaluate; a reused prefix is not counted.
+        self._record_usage(response.get('prompt_eval_count', 0), 0, response.get('eval_count', 0))
+        with self._timing_lock:
+            self.timing['requests'] += 1
+            for key, field in [('load', 'load_duration'), ('prompt_eval', 'prompt_eval_duration'),
+                               ('eval', 'eval_duration'), ('total', 'total_duration')]:
+                self.timing[key] += response.get(field, 0) / 1e9
+
+    def timing_report(self):
+        timing = self.timing
+        return (f"Ollama timing over {timing['requests']} requests: load {timing['load']:.1f}s, "
+                f"prompt eval {timing['prompt_eval']:.1f}s, generation {timing['eval']:.1f}s, "
+                f"server total {timing['total']:.1f}s")
+
+    def _get_response(self, system_prompt, user_prompt, timeout):
         try:
             response = self.client.chat(
                 model=self.model_name,
-                messages=[
-                    {'role': 'system', 'content': system_prompt},
-                    {'role': 'user', 'content': user_prompt},
-                ],
+                messages=self._messages(system_prompt, user_prompt),
 
-                options={"temperature": 0.0, "num_predict":128},
+                options=self.generation_params,
+                keep_alive=self.keep_alive,
             )
-
+            self._record_ollama(response)
             return response['message']['content']
         except Exception as e:
             print(f"Error during Ollama response: {e}")
             return None
 
-    def response(self, text: dict):
-        system_prompt, user_prompt = super().response(text)
-        response = self._get_response(system_prompt, user_prompt)
+    async def async_response(self, prompt: dict):
+        system_prompt, user_prompt = self.split_prompt(prompt, mode='basic')
+        _last_usage.set(None)
+        key, cached = self._cache_lookup(system_prompt, user_prompt)
+        if cached is not None:
+            return system_prompt + user_prompt, cached
+
+        response = None
+        for attempt in range(self.retries):
+            response = await self._async_get_response(system_prompt, user_prompt)
+            if response:
+                break
+        response = response or FAILED_RESPONSE
+        self._cache_store(key, response)
         return system_prompt + user_prompt, response
 
+    async def _async_get_response(self, system_prompt, user_prompt):
+        # httpx async clients are bound to the event loop they were created on.
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            from ollama import AsyncClient
+            self._async_client = AsyncClient(host=self.host, timeout=self.timeout)
+            self._async_loop = loop
+
+        try:
+            response = await self._async_client.chat(
+                model=self.model_name,
+                messages=self._messages(system_prompt, user_prompt),
+                options=self.generation_params,
+                keep_alive=self.keep_alive,
+            )
+            self._record_ollama(response)
+            return response['message']['content']
+        except Exception as e:
+            print(f"Error during Ollama response: {e}")
+            return None
+
 class OllamaLlama(OllamaBase):
     def __init__(self, api_key, args):
         super().__init__(api_key, args, model_name='llama3.1:8b-instruct-q8_0')
@@ -326,31 +728,37 @@ def load_api_keys():
     with open('api_keys.json', 'r') as file:
         return json.load(file)
 
+MODEL_CLASSES = {
+    'Gemini': Gemini,
+    'Sonnet': Claude,
+    'GPT4o': GPT,
+    'Llama': Llama,
+    'Qwen': Qwen,
+    'Gemma': Gemma,
+    'Ollama_Llama': OllamaLlama,
+    'Ollama_Qwen': OllamaQwen,
+    'Ollama_Gemma': OllamaGemma,
+    'Ollama_Mistral': OllamaMistral,
+    'Ollama_Phi': OllamaPhi,
+    'Ollama_Qwen32B': OllamaQwen32B,
+    'OllamaPhi3_5': OllamaPhi3_5,
+}
+
+
+def model_class(model_name):
+    # The class load_model() instantiates, for reading its quotas and prices without loading the model.
+    if model_name not in MODEL_CLASSES:
+        raise ValueError(f"Unknown model name: {model_name}")
+    return MODEL_CLASSES[model_name]
+
+
 def load_model(model_name, args):
+    cls = model_class(model_name)
     api_keys = load_api_keys()
-
-    if model_name == 'Gemini':
-        return Gemini(api_key=api_keys['Gemini'], args=args)
-    elif model_name == 'Sonnet':
-        return Claude(api_key=api_keys['Sonnet'], args=args)
-    elif model_name == 'GPT4o':
-        return GPT(api_key=api_keys['GPT4o'], args=args)
-    elif model_name == 'Ollama_Llama':
-        return OllamaLlama(api_key=api_keys['Ollama_Llama'], args=args)
-    elif model_name == 'Ollama_Qwen':
-        return OllamaQwen(api_key=api_keys['Ollama_Qwen'], args=args)
-    elif model_name == 'Ollama_Gemma':
-        return OllamaGemma(api_key=api_keys['Ollama_Gemma'], args=args)
-    elif model_name == 'Ollama_Mistral':
-        return OllamaMistral(api_key=api_keys['Ollama_Mistral'], args=args)
-    elif model_name == 'Ollama_Phi':
-        return OllamaPhi(api_key=api_keys['Ollama_Phi'], args=args)
-    elif model_name == 'Ollama_Qwen32B':
-        return OllamaQwen32B(api_key=api_keys['Ollama_Qwen32B'], args=args)
-    elif model_name == 'OllamaPhi3_5':
-        return OllamaPhi3_5(api_key=api_keys['OllamaPhi3_5'], args=args)
-    else:
-        raise ValueError(f"Unknown model name: {model_name}")
+    # Local Hugging Face models need no key.
+    if issubclass(cls, TransformersBase):
+        return cls(api_key=api_keys.get(model_name, ''), args=args)
+    return cls(api_key=api_keys[model_name], args=args)
 
 
 
@@ -0,0 +1,79 @@
+import json
+import os
+import time
+
+
+class RunJournal:
+    # Append-only record of the rows of one config that have been answered, kept as journal.jsonl in
+    # param_dir. A restarted run skips rows whose prompt hash matches a successful entry and only
+    # re-requests missing or failed rows. Records are fsynced in batches, not one by one.
+    def __init__(self, param_dir, sync_every=20, sync_interval=5.0):
+        self.path = os.path.join(param_dir, 'journal.jsonl')
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.meta = {}
+        self.completed = {}
+        # Stores holding the answers of the recorded rows; they are synced first, so the journal never
+        # marks a row done whose answer is not on disk yet (see result_writer).
+        self.stores = []
+        torn = self._load()
+        self.file = open(self.path, 'a', encoding='utf-8')
+        if torn:
+            # Terminate a half-written last line so the next record starts on a line of its own.
+            self.file.write('\n')
+        self.pending = 0
+        self.last_sync = time.time()
+
+    def _load(self):
+        # Returns True when the file ends in a half-written line.
+        if not os.path.exists(self.path):
+            return False
+        line = '\n'
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave the last line half written.
+                    continue
+                if record.get('type') == 'meta':
+                    self.meta.update(record['meta'])
+                elif record.get('failed'):
+                    self.completed.pop(record['index'], None)
+                else:
+                    self.completed[record['index']] = record['prompt_hash']
+        return not line.endswith('\n')
+
+    def is_done(self, index, prompt_hash):
+        return self.completed.get(index) == prompt_hash
+
+    def record_meta(self, **meta):
+        self.meta.update(meta)
+        self._append({'type': 'meta', 'meta': meta})
+        self.sync()
+
+    def record(self, index, prompt_hash, failed=False):
+        if failed:
+            self.completed.pop(index, None)
+        else:
+            self.completed[index] = prompt_hash
+        self._append({'index': index, 'prompt_hash': prompt_hash, 'failed': failed})
+
+    def _append(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.pending += 1
+        if self.pending >= self.sync_every or time.time() - self.last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        for store in self.stores:
+            store.sync()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_sync = time.time()
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
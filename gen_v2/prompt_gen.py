@@ -20,6 +20,58 @@ def conditional_format(template, **kwargs):
     return formatter.format(template, **relevant_kwargs)
 
 
+def compile_template(template):
+    # Parse a template once into its static text and the slots filled in per call. A slot's
+    # text stays empty unless render() gets a non-empty value for it, like conditional_format.
+    segments, slots = [], []
+    for literal, field_name, format_spec, conversion in SafeFormatter().parse(template):
+        segments.append(literal)
+        if field_name is not None:
+            slots.append((len(segments), field_name, format_spec, conversion))
+            segments.append('')
+    return segments, slots
+
+
+def render(plan, **kwargs):
+    segments, slots = plan
+    if not slots:
+        # Escaped braces ({{ }}) split the static text into several segments.
+        return ''.join(segments)
+    parts = list(segments)
+    for index, field_name, format_spec, conversion in slots:
+        value = kwargs.get(field_name)
+        if value:
+            if conversion:
+                value = SafeFormatter.convert_field(None, value, conversion)
+            parts[index] = format(value, format_spec)
+    return ''.join(parts)
+
+
+# A post cut to fit a token budget keeps this share of what is left from its start, the rest from its end.
+HEAD_SHARE = 0.7
+TRUNCATION_MARKER = ' [...] '
+PROMPT_PARTS = ('few_shot', 'system_instruction', 'task_query', 'prompt_strategy', 'context', 'label_def',
+                'output_indicator')
+
+
+def truncate_middle(text, max_tokens, count):
+    # The longest head + marker + tail of text that count() puts within max_tokens.
+    if count(text) <= max_tokens:
+        return text
+    kept = ''
+    low, high = 0, len(text)
+    while low <= high:
+        keep = (low + high) // 2
+        head = int(keep * HEAD_SHARE)
+        candidate = text[:head] + TRUNCATION_MARKER + text[len(text) - (keep - head):]
+        if count(candidate) <= max_tokens:
+            kept = candidate
+            low = keep + 1
+        else:
+            high = keep - 1
+    return kept
+
+
 class Prompt_Generator():
     def __init__(self, data_task, problem_task, data_name, SI, TQ, PS, CT, LD, OI, shot=0):
         self.template = self.load_prompt_template(data_task, problem_task)
@@ -34,31 +86,90 @@ class Prompt_Generator():
         self.OI = OI
         self.shot = shot
         self.prompt_template = self.extract_prompt_template()
+        self.compile()
+
+    def compile(self):
+        # Everything that is constant for the config: parsed templates and the evaluated label definitions.
+        self.plans = {key: compile_template(self.prompt_template[key])
+                      for key in ('few_shot', 'system_instruction', 'task_query', 'prompt_strategy', 'context',
+                                  'output_indicator')}
+        self.label_def = ast.literal_eval(self.prompt_template['label_def'].replace('‘', "'").replace('’', "'"))
+        self.label_def_contexts = {}
+
+    def label_def_context(self, label_list):
+        key = tuple(label_list)
+        if key not in self.label_def_contexts:
+            label_list_for_label_def = [word.strip() for item in label_list for word in item.split('&')]
+            label_def_context = {i: self.label_def[i] for i in label_list_for_label_def if i in self.label_def}
+            self.label_def_contexts[key] = label_def_context if label_def_context else ''
+        return self.label_def_contexts[key]
+
+    def fit_context(self, prompt, fields, token_budget, count, overhead=0, count_shared=None):
+        # Cuts the middle out of the input post until the prompt fits token_budget, recording under
+        # prompt['truncated'] the post's length before and after and the prompt's final length.
+        # overhead is what the model's general prompt adds around the parts; count_shared counts the
+        # few-shot block, which is the same for every row of a config and so only tokenized once.
+        # The cut prompt is counted again and cut further while the parts tokenize longer together than
+        # apart. When the rest of the prompt alone is over the budget, the post is cut entirely and the
+        # prompt is flagged over_budget.
+        fixed = overhead + (count_shared or count)(prompt['few_shot'])
+
+        def prompt_tokens():
+            return fixed + count(''.join(str(prompt[part]) for part in PROMPT_PARTS if part != 'few_shot'))
+
+        used = prompt_tokens()
+        if used <= token_budget:
+            return prompt
+        context_tokens = count(fields['context'])
+        max_tokens = context_tokens
+        while True:
+            max_tokens = max(max_tokens - (used - token_budget), 0)
+            context = truncate_middle(fields['context'], max_tokens, count)
+            prompt['context'] = render(self.plans['context'], **dict(fields, context=context))
+            used = prompt_tokens()
+            if used <= token_budget or not context:
+                break
+            max_tokens = min(max_tokens, count(context))
+        prompt['truncated'] = {'context_tokens': context_tokens, 'kept_tokens': count(context),
+                               'prompt_tokens': used, 'over_budget': used > token_budget}
+        return prompt
+
+    def pack_shots(self, shots, token_budget, count, max_shots, shortest_first=True):
+        # shots: [(index, rendered shot)]. Up to max_shots shots that fit token_budget together, taken
+        # shortest first, or in the given order (e.g. most similar first) until the next one does not fit.
+        candidates = [(count(shot), index, shot) for index, shot in shots]
+        if shortest_first:
+            candidates.sort()
+        chosen = []
+        used = 0
+        for tokens, index, shot in candidates:
+            if len(chosen) == max_shots or used + tokens > token_budget:
+                break
+            chosen.append((index, shot))
+            used += tokens
+        return chosen
 
-    def __call__(self, shot_memory='', context='', label='', label_text='', label_list='', subject='', shot_mode='basic', shot_count=0):
-        shot = conditional_format(self.prompt_template['few_shot'], shot_memory=shot_memory)
-        system_instruction = conditional_format(self.prompt_template['system_instruction'], context=context, subject=subject, label_list=label_list, label_text=label_text)
-        task_query = conditional_format(self.prompt_template['task_query'], context=context, subject=subject, label_list=label_list, label_text=label_text)
-        prompt_strategy = conditional_format(self.prompt_template['prompt_strategy'], context=context, subject=subject, label_list=label_list, label_text=label_text)
-        label_def = ast.literal_eval(self.prompt_template['label_def'].replace('‘', "'").replace('’', "'"))
-        label_list_for_label_def = [word.strip() for item in label_list for word in item.split('&')]
-        label_def_context = {i: label_def[i] for i in label_list_for_label_def if i in label_def}
-        if len(label_def_context.keys()) == 0:
-            label_def_context = ''
-        output_indicator = conditional_format(self.prompt_template['output_indicator'], context=context, subject=subject, label_list=label_list, label_text=label_text)
+    def __call__(self, shot_memory='', context='', label='', label_text='', label_list='', subject='', shot_mode='basic', shot_count=0,
+                 token_budget=None, count=None, overhead=0, count_shared=None):
+        plans = self.plans
+        fields = {'context': context, 'subject': subject, 'label_list': label_list, 'label_text': label_text}
+        shot = render(plans['few_shot'], shot_memory=shot_memory)
+        system_instruction = render(plans['system_instruction'], **fields)
+        task_query = render(plans['task_query'], **fields)
+        prompt_strategy = render(plans['prompt_strategy'], **fields)
+        label_def_context = self.label_def_context(label_list)
+        output_indicator = render(plans['output_indicator'], **fields)
 
         if shot_mode == 'few_shot':
             system_instruction = ''
             task_query = ''
             prompt_strategy = ''
             output_indicator = ''
-            context = conditional_format(self.prompt_template['prompt_strategy'], context=context, subject=subject,
-                                         label_list=label_list, label_text=label_text)
+            context = render(plans['prompt_strategy'], **fields)
         else:
             if shot_count != 0:
                 prompt_strategy = ''
-            context = conditional_format(self.prompt_template['context'], context=context, subject=subject,
-                                         label_list=label_list, label_text=label_text)
+            context = render(plans['context'], **fields)
 
         # if shot_count > 0:
         #     system_instruction = ''
@@ -77,8 +188,11 @@ class Prompt_Generator():
             'prompt_strategy': prompt_strategy,
             'context': context,
             'label_def': label_def_context,
-            'output_indicator': output_indicator
+            'output_indicator': output_indicator,
+            'label_list': label_list
         }
+        if token_budget and count is not None and shot_mode == 'basic':
+            prompt = self.fit_context(prompt, fields, token_budget, count, overhead, count_shared)
 
         return prompt
 
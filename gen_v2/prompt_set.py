@@ -0,0 +1,228 @@
+import argparse
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import time
+
+from cache import prompt_hash
+from gpt import BaseModel
+from tokens import counter_for
+
+# Pre-rendered prompts of one (dataset sample, template config) pair: the index, system prompt, user
+# prompt and prompt hash of every row, written once to ../cache/prompt_sets and never changed after.
+# The file name holds a hash of everything the prompts are rendered from (templates, general prompt,
+# few-shot block and rows), so every model and every rerun of a sweep reads the same set instead of
+# rendering the prompts again, and an edited template or a different sample gets a new set.
+# With a token budget, each prompt's input post is cut to fit it and the cut is recorded on the row.
+# With retrieved few-shot examples every row has its own few-shot block; the row records which
+# exemplar pool rows it uses.
+# Large sets are rendered over a process pool.
+#   python prompt_set.py --driver Efficient_auto_run_GPT    (renders a driver's sets ahead of a sweep)
+
+PROMPT_SET_DIR = '../cache/prompt_sets'
+# Below this many rows the set is rendered in-process; starting a pool costs more than it saves.
+PARALLEL_MIN_ROWS = 20000
+# Part of the key of budgeted sets; raised whenever Prompt_Generator.fit_context cuts prompts differently.
+FIT_VERSION = 2
+
+_renderer = None
+
+
+class RowShots:
+    # Each row's own few-shot examples (--shot_selection retrieval): the exemplar pool rows it uses and
+    # every used pool row's rendered example, kept once, so neither the set key nor the pool workers
+    # get a copy of every row's whole few-shot block.
+    def __init__(self, rows, texts):
+        self.rows = rows
+        self.texts = texts
+        digest = hashlib.sha256(json.dumps(sorted(rows.items())).encode('utf-8'))
+        for index in sorted(texts):
+            digest.update(texts[index].encode('utf-8') + b'\0')
+        self.digest = digest.hexdigest()
+
+    def memory(self, row):
+        return ''.join(self.texts[index] for index in self.rows[row])
+
+
+class PromptSet(list):
+    # The prompts of a set, with the key (PromptRenderer.key) its file is named by.
+    def __init__(self, prompts, key):
+        super().__init__(prompts)
+        self.key = key
+
+
+class PromptRenderer:
+    def __init__(self, prompter, shot, shot_memory='', shot_count=0, token_budget=None, model_cls=None,
+                 row_shots=None):
+        self.prompter = prompter
+        # A RowShots replacing shot_memory row by row.
+        self.row_shots = row_shots
+        # Only the general prompt template of the model is needed; it is the same for every model class.
+        self.model = BaseModel(api_key='', args=argparse.Namespace(shot=shot))
+        self.shot_memory = shot_memory
+        self.shot_count = shot_count
+        self.token_budget = token_budget
+        self.model_cls = model_cls
+        self.counter = None
+        self.overhead = 0
+        if token_budget:
+            # Budgets are counted with the tokenizer of the model the prompts are for.
+            self.counter = counter_for(model_cls)
+            empty = dict.fromkeys(('few_shot', 'system_instruction', 'task_query', 'prompt_strategy', 'context',
+                                   'label_def', 'output_indicator'), '')
+            self.overhead = self.counter.count_text(''.join(self.model.split_prompt(empty, mode='basic')))
+
+    def key(self, rows):
+        digest = hashlib.sha256()
+        budget = [self.token_budget, self.counter.name, FIT_VERSION] if self.token_budget else None
+        digest.update(json.dumps([self.prompter.prompt_template, self.model.general_prompts, self.shot_memory,
+                                  self.shot_count, budget], ensure_ascii=False, sort_keys=True).encode('utf-8'))
+        if self.row_shots is not None:
+            digest.update(self.row_shots.digest.encode('utf-8'))
+        for row in rows:
+            digest.update(json.dumps(row, ensure_ascii=False, default=str).encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def fixed_tokens(self, rows):
+        # The most tokens any row's prompt takes besides its input post and few-shot examples.
+        distinct = {json.dumps([label_list, subject], default=str): (label_list, subject)
+                    for _, _, _, _, label_list, subject in rows}
+        tokens = 0
+        for label_list, subject in distinct.values():
+            query = self.prompter(label_list=label_list, subject=subject, shot_count=self.model.args.shot)
+            tokens = max(tokens, self.counter.count_text(''.join(self.model.split_prompt(query, mode='basic'))))
+        return tokens
+
+    def __call__(self, rows):
+        rendered = []
+        for count, context, label, label_text, label_list, subject in rows:
+            shot_memory, shot_count, shots = self.shot_memory, self.shot_count, None
+            if self.row_shots is not None:
+                shot_memory, shots = self.row_shots.memory(count), self.row_shots.rows[count]
+                shot_count = len(shots)
+            # A row of a few-shot config whose examples were all dropped for the token budget keeps the
+            # few-shot layout; the prompt strategy slot would otherwise bring back the post and its label.
+            shot_count = shot_count or self.model.args.shot
+            query = self.prompter(
+                shot_memory=shot_memory,
+                context=context,
+                label=label,
+                label_text=label_text,
+                label_list=label_list,
+                subject=subject,
+                shot_count=shot_count,
+                token_budget=self.token_budget,
+                count=self.counter.count_text if self.counter is not None else None,
+                overhead=self.overhead,
+                # Retrieved blocks differ row by row; remembering each of them would only cost memory.
+                count_shared=self.counter.count_shared if self.counter is not None and shots is None else None
+            )
+            system_prompt, user_prompt = self.model.split_prompt(query, mode='basic')
+            prompt = {'index': count, 'system': system_prompt, 'user': user_prompt,
+                      'hash': prompt_hash(system_prompt + user_prompt), 'label_list': label_list}
+            if 'truncated' in query:
+                prompt['truncated'] = query['truncated']
+            if shots is not None:
+                prompt['shots'] = shots
+            rendered.append(prompt)
+        return rendered
+
+
+def _init_worker(prompter, shot, shot_memory, shot_count, token_budget, model_cls, row_shots):
+    global _renderer
+    _renderer = PromptRenderer(prompter, shot, shot_memory, shot_count, token_budget, model_cls, row_shots)
+
+
+def _render_chunk(rows):
+    return _renderer(rows)
+
+
+def dataset_rows(dataset, exclude=()):
+    # (index, context, label, label_text, label_list, subject) of every row that gets a prompt.
+    exclude = set(exclude)
+    rows = []
+    for count in range(len(dataset['context'])):
+        if count in exclude:
+            continue
+        if 'subject' in dataset and count < len(dataset['subject']):
+            subject = dataset['subject'][count]
+        else:
+            subject = None
+        rows.append((count, dataset['context'][count], dataset['label'][count], dataset['label_text'][count],
+                     dataset['label_list'][count], subject))
+    return rows
+
+
+def render(renderer, rows, workers=1):
+    if workers > 1 and len(rows) >= PARALLEL_MIN_ROWS and not multiprocessing.current_process().daemon:
+        chunk_size = -(-len(rows) // (workers * 4))
+        chunks = [rows[start:start + chunk_size] for start in range(0, len(rows), chunk_size)]
+        initargs = (renderer.prompter, renderer.model.args.shot, renderer.shot_memory, renderer.shot_count,
+                    renderer.token_budget, renderer.model_cls, renderer.row_shots)
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+            return [prompt for rendered in pool.map(_render_chunk, chunks) for prompt in rendered]
+    return renderer(rows)
+
+
+def read_prompt_set(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        prompts = [json.loads(line) for line in f]
+    return [prompt for prompt in prompts if prompt.get('type') != 'meta']
+
+
+def write_prompt_set(path, prompts, meta):
+    # Written under a temporary name and renamed, so a set is either complete or absent; two runs
+    # rendering the same set at once both write identical content.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'type': 'meta', **meta}, ensure_ascii=False) + '\n')
+        for prompt in prompts:
+            f.write(json.dumps(prompt, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, path)
+
+
+def load_prompt_set(args, dataset, prompter, shot_memory='', shot_count=0, exclude=(), root=PROMPT_SET_DIR,
+                    token_budget=None, model_cls=None, row_shots=None):
+    # Returns the PromptSet of the config, rendering and saving it the first time it is needed.
+    renderer = PromptRenderer(prompter, args.shot, shot_memory, shot_count, token_budget, model_cls, row_shots)
+    rows = dataset_rows(dataset, exclude)
+    key = renderer.key(rows)
+    path = os.path.join(root, f"{args.data}_{args.problem_task}_{key}.jsonl")
+    if os.path.exists(path):
+        return PromptSet(read_prompt_set(path), key)
+
+    start = time.time()
+    prompts = render(renderer, rows, workers=args.render_workers or os.cpu_count() or 1)
+    meta = {'data': args.data, 'problem_task': args.problem_task, 'SI': args.SI, 'TQ': args.TQ, 'PS': args.PS,
+            'CT': args.CT, 'LD': args.LD, 'OI': args.OI, 'shot': args.shot, 'excluded': sorted(exclude),
+            'token_budget': token_budget, 'shot_selection': 'retrieval' if row_shots is not None else 'random',
+            'count': len(prompts)}
+    write_prompt_set(path, prompts, meta)
+    print(f"Rendered {len(prompts)} prompts in {time.time() - start:.1f}s into {path}")
+    return PromptSet(prompts, key)
+
+
+if __name__ == '__main__':
+    from gpt import model_class
+    from sweep import SweepContext, group_by_dataset
+    from systematic_evaluation import config_prompts, parse_args
+
+    parser = argparse.ArgumentParser(description="Render the prompt sets of an auto_run driver's configs")
+    parser.add_argument('--driver', type=str, required=True,
+                        help='Driver module providing model_parameters and generate_commands()')
+    parser.add_argument('--max_rows', type=int, required=False, default=200)
+    args, base_args = parser.parse_known_args()
+
+    driver = importlib.import_module(args.driver)
+    context = SweepContext()
+    configs = group_by_dataset([parse_args(base_args + command)
+                                for command in driver.generate_commands(max_rows=args.max_rows)])
+    for config_args in configs:
+        dataset = context.dataset(config_args)
+        prompter = context.prompter(config_args)
+        # Models with the same token budget share a set; the others get one each.
+        for model_name in driver.model_parameters:
+            config_prompts(config_args, dataset, prompter, model_class(model_name), context=context)
@@ -0,0 +1,129 @@
+import email.utils
+import os
+import random
+import sqlite3
+import threading
+import time
+
+
+class RateLimiter:
+    # Requests/min and tokens/min token buckets for one provider. The bucket state lives in a
+    # SQLite file so every thread and every systematic_evaluation process of a sweep draws from it.
+    def __init__(self, name, rpm=None, tpm=None, path='../cache/rate_limits.sqlite'):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.path = path
+        self.local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute('CREATE TABLE IF NOT EXISTS buckets ('
+                     'name TEXT PRIMARY KEY, requests REAL, tokens REAL, updated REAL, blocked_until REAL)')
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # isolation_level=None so BEGIN IMMEDIATE below controls the transaction.
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self.local.conn = conn
+        return conn
+
+    def acquire(self, tokens=0):
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def _try_acquire(self, tokens):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            requests, available, blocked_until = self._refill(conn, now)
+
+            if blocked_until > now:
+                wait = blocked_until - now
+            else:
+                wait = 0.0
+                if self.rpm and requests < 1:
+                    wait = max(wait, (1 - requests) * 60.0 / self.rpm)
+                # A single request larger than the whole bucket only has to wait for a full bucket.
+                needed = min(tokens, self.tpm) if self.tpm else 0
+                if self.tpm and available < needed:
+                    wait = max(wait, (needed - available) * 60.0 / self.tpm)
+                if wait <= 0:
+                    requests -= 1
+                    available -= needed
+
+            conn.execute('INSERT OR REPLACE INTO buckets (name, requests, tokens, updated, blocked_until) '
+                         'VALUES (?, ?, ?, ?, ?)', (self.name, requests, available, now, blocked_until))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return wait
+
+    def _refill(self, conn, now):
+        row = conn.execute('SELECT requests, tokens, updated, blocked_until FROM buckets WHERE name = ?',
+                           (self.name,)).fetchone()
+        if row is None:
+            return self.rpm or 0, self.tpm or 0, 0.0
+
+        requests, available, updated, blocked_until = row
+        elapsed = max(0.0, now - updated)
+        if self.rpm:
+            requests = min(self.rpm, requests + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            available = min(self.tpm, available + elapsed * self.tpm / 60.0)
+        return requests, available, blocked_until
+
+    def penalize(self, seconds):
+        # The provider told us to back off: pause every worker sharing this bucket.
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            requests, available, blocked_until = self._refill(conn, now)
+            blocked_until = max(blocked_until, now + seconds)
+            conn.execute('INSERT OR REPLACE INTO buckets (name, requests, tokens, updated, blocked_until) '
+                         'VALUES (?, ?, ?, ?, ?)', (self.name, requests, available, now, blocked_until))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+
+def is_rate_limit_error(error):
+    # openai/anthropic errors carry status_code, google.api_core errors carry code.
+    return getattr(error, 'status_code', None) == 429 or getattr(error, 'code', None) == 429
+
+
+def retry_after_seconds(error):
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers:
+        if headers.get('retry-after-ms'):
+            try:
+                return float(headers['retry-after-ms']) / 1000.0
+            except ValueError:
+                pass
+        if headers.get('retry-after'):
+            value = headers['retry-after']
+            try:
+                return float(value)
+            except ValueError:
+                try:
+                    return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+    return None
+
+
+def backoff_delay(attempt, retry_after=None, base=1.0, cap=60.0):
+    # Honour the server's Retry-After when given, otherwise exponential backoff with full jitter.
+    if retry_after is not None:
+        return retry_after + random.uniform(0, base)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
@@ -0,0 +1,151 @@
+import argparse
+import hashlib
+import json
+import os
+
+from gpt import INPUT_MARKER
+
+# One append-only JSONL shard per (config, model) directory instead of a query/answer .txt pair per
+# sample. Each row holds index, prompt_hash, answer, true_label, label_list, latency and token counts.
+# The query is stored as three parts: the text before the input (system prompt, few-shot block,
+# prompt strategy) and the text from the output section on are the same for every row of a config,
+# so each is written once as a segment record and rows only refer to it by id; only the input part
+# is stored per row. label_list, also shared by the rows of a config, is stored the same way.
+# read_results() puts the full records back together.
+# export_txt() writes the legacy query{index}.txt / answer{index}.txt layout back out.
+
+RESULTS_FILE = 'results.jsonl'
+OUTPUT_MARKER = '###Output###'
+
+
+def split_query(query_text):
+    # (prefix, input part, suffix) of a rendered prompt; the three concatenate back to query_text.
+    start = query_text.find(INPUT_MARKER)
+    if start < 0:
+        start = 0
+    end = query_text.rfind(OUTPUT_MARKER)
+    if end < start:
+        end = len(query_text)
+    return query_text[:start], query_text[start:end], query_text[end:]
+
+
+def ends_torn(path):
+    # True when the file ends in a half-written line, as a crash mid-write can leave it.
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b'\n'
+
+
+class ResultStore:
+    def __init__(self, param_dir):
+        self.path = os.path.join(param_dir, RESULTS_FILE)
+        torn = ends_torn(self.path)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        if torn:
+            # Terminate a half-written last line so the next record starts on a line of its own.
+            self.file.write('\n')
+        # Segments written by this store; a resumed run may write a segment again, readers dedupe by id.
+        self.segments = set()
+
+    def _segment(self, text):
+        segment_id = hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+        if segment_id not in self.segments:
+            self.segments.add(segment_id)
+            self.file.write(json.dumps({'type': 'segment', 'id': segment_id, 'text': text}, ensure_ascii=False) + '\n')
+        return segment_id
+
+    def append(self, record):
+        record = dict(record)
+        prefix, query_input, suffix = split_query(record.pop('query'))
+        record['query_prefix'] = self._segment(prefix)
+        record['query_input'] = query_input
+        record['query_suffix'] = self._segment(suffix)
+        if record.get('label_list') is not None:
+            record['label_list'] = self._segment(json.dumps(record['label_list'], ensure_ascii=False))
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def sync(self):
+        if not self.file.closed:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+
+def has_results(param_dir):
+    return os.path.exists(os.path.join(param_dir, RESULTS_FILE))
+
+
+def read_results(param_dir, queries=True):
+    # Latest record per index, in index order; a resumed run appends new answers for retried rows.
+    # With queries=True each record gets its full 'query' text back.
+    records = {}
+    segments = {}
+    with open(os.path.join(param_dir, RESULTS_FILE), 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('type') == 'segment':
+                segments[record['id']] = record['text']
+            else:
+                records[record['index']] = record
+
+    results = []
+    missing = []
+    for index in sorted(records):
+        record = records[index]
+        # A crash can lose a segment record; rows referring to it cannot be put back together.
+        ids = [record.get('label_list')] if record.get('label_list') is not None else []
+        if queries:
+            ids += [record['query_prefix'], record['query_suffix']]
+        if any(segment_id not in segments for segment_id in ids):
+            missing.append(index)
+            continue
+        if record.get('label_list') is not None:
+            record['label_list'] = json.loads(segments[record['label_list']])
+        if queries:
+            record['query'] = (segments[record['query_prefix']] + record['query_input'] +
+                               segments[record['query_suffix']])
+        results.append(record)
+    if missing:
+        print(f"Warning: skipped {len(missing)} rows of {param_dir} whose shared prompt parts were lost "
+              f"(rows {missing[:10]}{' ...' if len(missing) > 10 else ''})")
+    return results
+
+
+def answer_text(record):
+    # The answer{index}.txt content the evaluation scripts parse.
+    text = record['answer']
+    if record.get('true_label') is not None:
+        text += '\n\n' + 'TrueAnswer:' + str(record['true_label'])
+        text += '\n\n' + 'TrueLabellist:' + str(record['label_list'])
+    return text
+
+
+def export_txt(param_dir, out_dir=None):
+    out_dir = out_dir or param_dir
+    os.makedirs(out_dir, exist_ok=True)
+    records = read_results(param_dir)
+    for record in records:
+        with open(os.path.join(out_dir, f"query{record['index']}.txt"), 'w', encoding='utf-8') as f:
+            f.write(record['query'])
+        with open(os.path.join(out_dir, f"answer{record['index']}.txt"), 'w', encoding='utf-8') as f:
+            f.write(answer_text(record))
+    return len(records)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export results.jsonl shards to the legacy query/answer .txt files')
+    parser.add_argument('path', type=str, help='A result directory, or a tree of them (e.g. ../results)')
+    args = parser.parse_args()
+
+    for root, _, files in os.walk(args.path):
+        if RESULTS_FILE in files:
+            print(f"{root}: exported {export_txt(root)} rows")
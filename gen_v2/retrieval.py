@@ -0,0 +1,106 @@
+import hashlib
+import os
+import time
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+# Nearest-neighbour few-shot exemplars (--shot_selection retrieval). Every post of a dataset's
+# exemplar pool is turned into a TF-IDF weighted vector of hashed word unigrams and bigrams, so no
+# vocabulary has to be fitted or stored. The vectors are saved once per pool under ../cache/retrieval
+# and loaded by later runs. Terms found in more than MAX_DF_SHARE of the posts (stop words, mostly)
+# are left out of the vectors, so a query is only scored against the posts sharing one of its
+# informative terms: a batch of sparse dot products over short posting lists instead of the whole pool.
+# Small pools keep every term found in up to MIN_DF_CUTOFF posts; their posting lists are short anyway,
+# and a share of a few hundred posts would prune most content words.
+
+INDEX_DIR = '../cache/retrieval'
+N_FEATURES = 2 ** 18
+MAX_DF_SHARE = 0.05
+MIN_DF_CUTOFF = 100
+QUERY_BATCH = 256
+
+
+def _vectorizer():
+    return HashingVectorizer(ngram_range=(1, 2), n_features=N_FEATURES, alternate_sign=False, norm=None)
+
+
+class ExemplarIndex:
+    def __init__(self, postings, idf):
+        # postings: (term x post) CSR matrix of the pool's normalized TF-IDF vectors, so a term's
+        # row lists the posts containing it.
+        self.postings = postings
+        self.idf = idf
+
+    @classmethod
+    def build(cls, texts):
+        counts = _vectorizer().transform(texts).tocsr()
+        document_frequency = np.bincount(counts.indices, minlength=N_FEATURES)
+        # Smoothed idf, as sklearn's TfidfTransformer computes it.
+        idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+        idf[document_frequency > max(MIN_DF_CUTOFF, MAX_DF_SHARE * len(texts))] = 0
+        matrix = (counts @ sparse.diags(idf)).tocsr()
+        matrix.eliminate_zeros()
+        return cls(normalize(matrix).T.tocsr(), idf)
+
+    def vectorize(self, texts):
+        vectors = (_vectorizer().transform(texts) @ sparse.diags(self.idf)).tocsr()
+        vectors.eliminate_zeros()
+        return normalize(vectors).tocsr()
+
+    def search(self, texts, k):
+        # (indices, scores) of the k most similar pool posts for each text, most similar first. A text
+        # sharing no informative term with k posts is topped up with the first other posts of the pool.
+        k = min(k, self.postings.shape[1])
+        queries = self.vectorize(texts)
+        results = []
+        for start in range(0, queries.shape[0], QUERY_BATCH):
+            scores = (queries[start:start + QUERY_BATCH] @ self.postings).tocsr()
+            for row in range(scores.shape[0]):
+                hits = scores.indices[scores.indptr[row]:scores.indptr[row + 1]]
+                values = scores.data[scores.indptr[row]:scores.indptr[row + 1]]
+                if len(hits) > k:
+                    top = np.argpartition(-values, k - 1)[:k]
+                    hits, values = hits[top], values[top]
+                order = np.argsort(-values, kind='stable')
+                hits, values = hits[order], values[order]
+                if len(hits) < k:
+                    extra = np.setdiff1d(np.arange(2 * k), hits)[:k - len(hits)]
+                    hits = np.concatenate([hits, extra])
+                    values = np.concatenate([values, np.zeros(len(extra))])
+                results.append((hits, values))
+        return results
+
+    def save(self, path):
+        # Written under a temporary name and renamed, so an index is either complete or absent.
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, data=self.postings.data, indices=self.postings.indices, indptr=self.postings.indptr,
+                 shape=np.array(self.postings.shape), idf=self.idf)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        arrays = np.load(path)
+        postings = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                     shape=tuple(arrays['shape']))
+        return cls(postings, np.asarray(arrays['idf']))
+
+
+def load_index(name, texts, root=INDEX_DIR):
+    # The index of a pool of posts, vectorized the first time the pool is seen.
+    # Keyed by the pool and by how its terms are weighted, so a changed cutoff builds a new index.
+    digest = hashlib.sha256(repr((N_FEATURES, MAX_DF_SHARE, MIN_DF_CUTOFF)).encode('utf-8'))
+    for text in texts:
+        digest.update(text.encode('utf-8') + b'\0')
+    path = os.path.join(root, f"{name}_{digest.hexdigest()[:16]}.npz")
+    if os.path.exists(path):
+        return ExemplarIndex.load(path)
+
+    start = time.time()
+    index = ExemplarIndex.build(texts)
+    index.save(path)
+    print(f"Indexed {len(texts)} exemplars in {time.time() - start:.1f}s into {path}")
+    return index
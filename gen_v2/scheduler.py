@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import heapq
+import importlib
+import itertools
+import os
+import time
+
+from engine import request
+from gpt import load_model
+from sweep import SweepContext
+from systematic_evaluation import OUTPUT_BASE_DIR, parse_args, prepare_config, report_finished, result_writer
+
+# Runs a whole sweep (model x config x sample) in one event loop. Every provider gets its own queue
+# and as many workers as its concurrency, so a fast provider keeps going while a slow one works
+# through its backlog; rate budgets are enforced by each model's RateLimiter as usual.
+# The transformers models keep their length-bucketed batch generation (or log-likelihood scoring):
+# their configs are run one after another on the model's own thread instead of request by request.
+# Configs are rendered up front against one shared model per provider, so all configs of a provider
+# must agree on the options the model is configured with (MODEL_OPTIONS); --batch is not supported.
+#   python scheduler.py --driver Efficient_auto_run_GPT Efficient_auto_run_Gemini Efficient_auto_run_Seq
+
+MODEL_OPTIONS = ('scoring', 'keep_alive', 'concurrency', 'gen_batch_size', 'cache', 'cache_max_mb', 'rpm', 'tpm',
+                 'rate_limits', 'hf_model_id', 'base_url')
+
+
+class ConfigJob:
+    def __init__(self, args, model_name, param_dir, on_result, close, total):
+        self.args = args
+        self.model_name = model_name
+        self.param_dir = param_dir
+        self.on_result = on_result
+        self.close = close
+        self.remaining = total
+
+
+class ProviderQueue:
+    def __init__(self, name, model, options):
+        self.name = name
+        self.model = model
+        self.options = options
+        self.heap = []
+        self.in_flight = 0
+        self.done = 0
+        self.started = None
+        self.finished = None
+
+    def status(self, now):
+        elapsed = (self.finished or now) - (self.started or now)
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        return (f"{self.name}: {len(self.heap)} queued, {self.in_flight} in flight, {self.done} done, "
+                f"{rate:.2f} req/s")
+
+
+class SweepScheduler:
+    def __init__(self, status_interval=30):
+        self.status_interval = status_interval
+        self.context = SweepContext()
+        self.providers = {}
+        self.sequence = itertools.count()
+
+    def add_config(self, args, model_name, priority=0):
+        # Lower priority values are served first; within a priority, configs keep the order they were added.
+        if args.batch:
+            raise ValueError(f"{model_name}: scheduler.py sends requests one by one; run --batch configs with "
+                             f"systematic_evaluation.py or sweep.py")
+        options = {option: getattr(args, option) for option in MODEL_OPTIONS}
+        provider = self.providers.get(model_name)
+        if provider is None:
+            provider = ProviderQueue(model_name, load_model(model_name, args), options)
+            self.providers[model_name] = provider
+        elif options != provider.options:
+            # The model is shared by every queued config, so a later config's settings would apply to all of them.
+            changed = ', '.join(f"--{option} {options[option]} (was {provider.options[option]})"
+                                for option in MODEL_OPTIONS if options[option] != provider.options[option])
+            raise ValueError(f"{model_name}: configs of one provider must share the model options; got {changed}. "
+                             f"Run them in a separate scheduler.py or sweep.py invocation.")
+        model = provider.model
+
+        dataset, param_dir, queries, journal = prepare_config(args, model_name, OUTPUT_BASE_DIR, model, self.context)
+        if not queries:
+            journal.close()
+            return
+        on_result, close = result_writer(args, dataset, param_dir, journal)
+        job = ConfigJob(args, model_name, param_dir, on_result, close, len(queries))
+        for key, query in queries:
+            # Queries come rendered from the config's prompt set, so they do not depend on how the
+            # shared model is configured by the time they are sent.
+            heapq.heappush(provider.heap, (priority, next(self.sequence), job, key, query))
+
+    def status_report(self):
+        now = time.time()
+        return '\n'.join(provider.status(now) for provider in self.providers.values())
+
+    def _finish(self, provider, job, key, response, usage=None, latency=None):
+        provider.done += 1
+        job.on_result(key, response, usage, latency)
+        job.remaining -= 1
+        if job.remaining == 0:
+            job.close()
+            report_finished(job.model_name, provider.model, job.param_dir)
+
+    async def _worker(self, provider):
+        while provider.heap:
+            _, _, job, key, query = heapq.heappop(provider.heap)
+            provider.in_flight += 1
+            try:
+                response, usage, latency = await request(provider.model, query)
+            finally:
+                provider.in_flight -= 1
+            self._finish(provider, job, key, response, usage, latency)
+
+    def _run_batched(self, provider):
+        # Each config's queries in priority order, handed to batch_response a config at a time.
+        jobs = {}
+        while provider.heap:
+            _, _, job, key, query = heapq.heappop(provider.heap)
+            jobs.setdefault(job, []).append((key, query))
+        for job, queries in jobs.items():
+            provider.in_flight = len(queries)
+            for key, response, usage in provider.model.batch_response(queries):
+                provider.in_flight -= 1
+                self._finish(provider, job, key, response, usage)
+
+    async def _provider(self, provider):
+        provider.started = time.time()
+        if hasattr(provider.model, 'batch_response'):
+            await asyncio.get_running_loop().run_in_executor(provider.model.executor, self._run_batched, provider)
+        else:
+            await asyncio.gather(*(self._worker(provider) for _ in range(max(1, provider.model.concurrency))))
+        provider.finished = time.time()
+        print(f"Provider finished: {provider.status(provider.finished)}")
+
+    async def _report_status(self):
+        while True:
+            await asyncio.sleep(self.status_interval)
+            print(self.status_report(), flush=True)
+
+    async def _run(self):
+        status = asyncio.create_task(self._report_status())
+        try:
+            await asyncio.gather(*(self._provider(provider) for provider in self.providers.values()))
+        finally:
+            status.cancel()
+
+    def run(self):
+        try:
+            asyncio.run(self._run())
+        finally:
+            for provider in self.providers.values():
+                provider.model.close()
+        print(self.status_report())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the configs of several auto_run drivers across providers at once')
+    parser.add_argument('--driver', type=str, nargs='+', required=True,
+                        help='Driver modules providing model_parameters and generate_commands()')
+    parser.add_argument('--max_rows', type=int, required=False, default=200)
+    parser.add_argument('--status_interval', type=int, required=False, default=30,
+                        help='Seconds between queue depth / throughput reports')
+    args, base_args = parser.parse_known_args()
+
+    configs = []
+    for driver_name in args.driver:
+        driver = importlib.import_module(driver_name)
+        for model_name in driver.model_parameters:
+            for priority, command in enumerate(driver.generate_commands(max_rows=args.max_rows)):
+                configs.append((priority, model_name, parse_args(['--models', model_name] + base_args + command)))
+
+    os.makedirs(OUTPUT_BASE_DIR, exist_ok=True)
+    scheduler = SweepScheduler(status_interval=args.status_interval)
+    # Prepare configs grouped by dataset so each one is loaded and sampled once.
+    configs.sort(key=lambda item: (item[2].data, item[2].dataset_revision, item[2].max_rows))
+    for priority, model_name, config_args in configs:
+        scheduler.add_config(config_args, model_name, priority=priority)
+    scheduler.run()
@@ -0,0 +1,96 @@
+import argparse
+import importlib
+import os
+import time
+
+from gpt import load_model
+from systematic_evaluation import (OUTPUT_BASE_DIR, build_prompter, gen, load_config_dataset, load_exemplar_pool,
+                                   parse_args)
+
+# Runs the configs of an auto_run driver in this process: each model is loaded once, each dataset
+# is loaded and sampled once per (data, revision, max_rows, sampling), and each prompt template combo is parsed once.
+#   python sweep.py --driver Efficient_auto_run_GPT
+
+
+class SweepContext:
+    def __init__(self):
+        self.datasets = {}
+        self.prompters = {}
+        self.pools = {}
+        self.timings = []
+
+    def dataset(self, args):
+        key = (args.data, args.dataset_revision, args.max_rows, args.sample_seed, args.sample_replace)
+        if key not in self.datasets:
+            # Configs arrive grouped by dataset, so only the current group's data is kept in memory.
+            self.datasets.clear()
+            self.datasets[key] = load_config_dataset(args)
+        return self.datasets[key]
+
+    def exemplar_pool(self, args):
+        # The whole dataset, for retrieved few-shot examples; kept for the current dataset only.
+        key = (args.data, args.dataset_revision)
+        if key not in self.pools:
+            self.pools.clear()
+            self.pools[key] = load_exemplar_pool(args)
+        return self.pools[key]
+
+    def prompter(self, args):
+        key = (args.data_task, args.problem_task, args.data, args.SI, args.TQ, args.PS, args.CT, args.LD, args.OI)
+        if key not in self.prompters:
+            self.prompters[key] = build_prompter(args)
+        return self.prompters[key]
+
+    def run(self, args, model_name, model):
+        start = time.time()
+        requests = gen(args, model_name, OUTPUT_BASE_DIR, model=model, context=self)
+        elapsed = max(time.time() - start, 1e-6)
+        self.timings.append((f"{args.data} {args.SI} {args.TQ} {args.PS} shot-{args.shot}", requests, elapsed))
+        print(f"Config finished: {requests} requests in {elapsed:.1f}s ({requests / elapsed:.2f} req/s)")
+
+    def report(self):
+        lines = [f"{'config':<70} {'requests':>8} {'seconds':>9} {'req/s':>7}"]
+        for name, requests, elapsed in self.timings:
+            lines.append(f"{name:<70} {requests:>8} {elapsed:>9.1f} {requests / elapsed:>7.2f}")
+        total_requests = sum(requests for _, requests, _ in self.timings)
+        total_elapsed = sum(elapsed for _, _, elapsed in self.timings)
+        if total_elapsed:
+            lines.append(f"{'total':<70} {total_requests:>8} {total_elapsed:>9.1f} "
+                         f"{total_requests / total_elapsed:>7.2f}")
+        return '\n'.join(lines)
+
+
+def group_by_dataset(configs):
+    # Stable, so configs of one dataset keep their driver order.
+    return sorted(configs, key=lambda args: (args.data, args.dataset_revision, args.max_rows))
+
+
+def run_sweep(model_name, commands, base_args=()):
+    configs = group_by_dataset([parse_args(['--models', model_name] + list(base_args) + list(command))
+                                for command in commands])
+    if not configs:
+        return
+    os.makedirs(OUTPUT_BASE_DIR, exist_ok=True)
+    start = time.time()
+    model = load_model(model_name, configs[0])
+    print(f"Loaded {model_name} in {time.time() - start:.1f}s")
+
+    context = SweepContext()
+    try:
+        for args in configs:
+            context.run(args, model_name, model)
+    finally:
+        model.close()
+        print(context.report())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the configs of an auto_run driver in one process')
+    parser.add_argument('--driver', type=str, required=True,
+                        help='Driver module providing model_parameters and generate_commands(), e.g. Efficient_auto_run_GPT')
+    parser.add_argument('--max_rows', type=int, required=False, default=200)
+    args, base_args = parser.parse_known_args()
+
+    driver = importlib.import_module(args.driver)
+    for model_name in driver.model_parameters:
+        run_sweep(model_name, driver.generate_commands(max_rows=args.max_rows), base_args)
@@ -1,112 +1,355 @@
 import argparse
 from dataset import load_dataset, preprocess_data_with_balanced_sampling
 from prompt_gen import Prompt_Generator
-from gpt import load_model, BaseModel
+from gpt import FAILED_RESPONSE, load_model, BaseModel
+from cache import prompt_hash
+from journal import RunJournal
+from result_store import ResultStore
+from prompt_set import PromptRenderer, RowShots, dataset_rows, load_prompt_set
+from tokens import counter_for
+from engine import run_requests
+from batch_api import batch_runner
 from tqdm import tqdm
 import random
+import time
 from joblib import Parallel, delayed
 from multiprocessing import Pool
 
 import os
 import ast
+import json
 
+OUTPUT_BASE_DIR = '../results'
+# With a token budget, few-shot examples may use what the rest of the prompt leaves of it, less
+# MIN_INPUT_SHARE of it kept for the input post, so examples are dropped before the input is cut away.
+# Randomly drawn examples that do not fit are replaced by the shortest that do among SHOT_POOL times
+# as many candidates; retrieved ones (--shot_selection retrieval) are taken nearest first while they fit.
+SHOT_POOL = 4
+MIN_INPUT_SHARE = 0.25
+# Datasets whose rows are conversations ({turn: utterance}) rather than one post.
+CONVERSATION_DATASETS = ('iemocap',)
 
-def gen(args, model_name, output_dir):
-    dataset = load_dataset(dataset_name=args.data)
-    dataset = preprocess_data_with_balanced_sampling(dataset_name=args.data, dataset=dataset, max_rows=args.max_rows)
-
-    model = load_model(model_name, args)
-    prompter = Prompt_Generator(args.data_task, args.problem_task, args.data, args.SI, args.TQ, args.PS, args.CT,
-                                args.LD,args.OI)
-
-    shot_count = 0
-    shot_memory = ''
-
-    if args.shot > 0:
-        teacher_forcing = True
-        base_model = BaseModel(api_key='', args=args)
-        select_shot = random.sample(range(len(dataset['context'])), min(args.shot, len(dataset['context'])))
-        #select_shot = [i for i in range(args.shot)]
-        for s in select_shot:
-            context = dataset['context'][s]
-            label = dataset['label'][s]
-            label_text = dataset['label_text'][s]
-            label_list = dataset['label_list'][s]
-
-            if 'subject' in dataset and s < len(dataset['subject']):
-                subject = dataset['subject'][s]
-            else:
-                subject = None  # subject가 없는 경우 None 할당
-
-            shot = prompter(
-                shot_memory='',
-                context=context,
-                label=label,
-                label_text=label_text,
-                label_list=label_list,
-                subject=subject,
-                shot_mode='few_shot',
-                shot_count=shot_count
-            )
-
-            if teacher_forcing:
-                system_prompt, user_prompt = base_model.split_prompt(shot, mode='few_shot')
-                shot_memory += (system_prompt + user_prompt)
-            else:
-                sample = model.response(shot)
-                shot_memory += sample[0] + sample[1]
-            shot_count += 1
 
+def write_result(args, dataset, param_dir, count, query_text, answer_text):
+    with open(os.path.join(param_dir, f'query{count}.txt'), 'w', encoding='utf-8') as f:
+        f.write(query_text)
+    with open(os.path.join(param_dir, f'answer{count}.txt'), 'w', encoding='utf-8') as f:
+        f.write(answer_text)
+        if args.problem_task == 'Classification':
+            f.write('\n\n' + 'TrueAnswer:' + str(dataset['label_text'][count]))
+            f.write('\n\n' + 'TrueLabellist:' + str(dataset['label_list'][count]))
+
+
+def load_config_dataset(args):
+    dataset = load_dataset(dataset_name=args.data, revision=args.dataset_revision)
+    return preprocess_data_with_balanced_sampling(dataset_name=args.data, dataset=dataset, max_rows=args.max_rows,
+                                                  seed=args.sample_seed, replace=args.sample_replace)
+
+
+def build_prompter(args):
+    return Prompt_Generator(args.data_task, args.problem_task, args.data, args.SI, args.TQ, args.PS, args.CT,
+                            args.LD, args.OI)
+
+
+def token_budget(args, cls):
+    # --token_budget overrides the model class's context_budget; 0 leaves prompts whole.
+    budget = args.token_budget if args.token_budget is not None else cls.context_budget
+    return budget or None
+
+
+def select_shots(args, dataset, journal=None):
+    # Indices of the args.shot few-shot examples. They are drawn with --sample_seed, so every model of
+    # a sweep gets the same examples and shares one prompt set; a resumed run reuses those of the interrupted one.
+    if args.shot <= 0:
+        return []
+    shot_total = min(args.shot, len(dataset['context']))
+    select_shot = journal.meta.get('select_shot') if journal is not None else None
+    if (select_shot is None or len(select_shot) != shot_total
+            or any(s >= len(dataset['context']) for s in select_shot)):
+        select_shot = random.Random(args.sample_seed).sample(range(len(dataset['context'])), shot_total)
+        if journal is not None:
+            journal.record_meta(select_shot=select_shot)
+    return select_shot
+
+
+def render_shots(args, dataset, prompter, rows, model=None):
+    # [(row, rendered few-shot example)] for the given rows of dataset.
+    teacher_forcing = True
+    base_model = BaseModel(api_key='', args=args)
+    rendered = []
+    #select_shot = [i for i in range(args.shot)]
+    for shot_count, s in enumerate(rows):
+        context = dataset['context'][s]
+        label = dataset['label'][s]
+        label_text = dataset['label_text'][s]
+        label_list = dataset['label_list'][s]
+
+        if 'subject' in dataset and s < len(dataset['subject']):
+            subject = dataset['subject'][s]
+        else:
+            subject = None  # subject가 없는 경우 None 할당
+
+        shot = prompter(
+            shot_memory='',
+            context=context,
+            label=label,
+            label_text=label_text,
+            label_list=label_list,
+            subject=subject,
+            shot_mode='few_shot',
+            shot_count=shot_count
+        )
+
+        if teacher_forcing:
+            system_prompt, user_prompt = base_model.split_prompt(shot, mode='few_shot')
+            rendered.append((s, system_prompt + user_prompt))
+        else:
+            sample = model.response(shot)
+            rendered.append((s, sample[0] + sample[1]))
+    return rendered
+
+
+def spare_shots(args, dataset, select_shot):
+    # Further few-shot candidates for drawn examples too long for the token budget, drawn with --sample_seed.
+    drawn = set(select_shot)
+    rest = [i for i in range(len(dataset['context'])) if i not in drawn]
+    return random.Random(args.sample_seed).sample(rest, min(args.shot * (SHOT_POOL - 1), len(rest)))
+
+
+def shot_budget(args, dataset, prompter, model_cls, budget):
+    # Tokens the few-shot examples of a row may take together under a token budget (see MIN_INPUT_SHARE).
+    renderer = PromptRenderer(prompter, args.shot, token_budget=budget, model_cls=model_cls)
+    fixed = renderer.fixed_tokens(dataset_rows(dataset))
+    return max(budget - fixed - int(budget * MIN_INPUT_SHARE), 0)
+
+
+def few_shot_memory(args, dataset, prompter, select_shot, model=None, shot_budget=None, count=None):
+    # Returns (shot_memory, shot_count, shots): the rendered few-shot block put in front of every
+    # prompt and the rows it uses. With a shot budget the drawn examples are kept when they fit it
+    # together; otherwise the shortest of them and of spare_shots() that fit are used, at most
+    # args.shot of them.
+    if not select_shot:
+        return '', 0, []
+    rendered = render_shots(args, dataset, prompter, select_shot, model)
+    if shot_budget is not None and sum(count(shot) for _, shot in rendered) > shot_budget:
+        rendered += render_shots(args, dataset, prompter, spare_shots(args, dataset, select_shot), model)
+        rendered = prompter.pack_shots(rendered, shot_budget, count, args.shot)
+    return ''.join(shot for _, shot in rendered), len(rendered), [s for s, _ in rendered]
+
+
+def load_exemplar_pool(args):
+    # Every row of the dataset, preprocessed like a sample, as the pool retrieved exemplars come from.
+    dataset = load_dataset(dataset_name=args.data, revision=args.dataset_revision)
+    return preprocess_data_with_balanced_sampling(dataset_name=args.data, dataset=dataset,
+                                                  max_rows=len(dataset['train']), replace='without')
+
+
+def retrieved_shots(args, dataset, prompter, pool, model=None, shot_budget=None, count=None):
+    # A prompt_set.RowShots: each row's own few-shot examples, the pool posts most similar to its
+    # post, nearest first. The post itself is never its own example. With a shot budget, as many of
+    # the nearest as fit it are used, at most args.shot.
+    # Imported here: scipy and sklearn would add most of a second to every run's start-up otherwise.
+    from retrieval import load_index
+    index = load_index(f"{args.data}_{args.dataset_revision}", pool['context'])
+    start = time.time()
+    neighbours = index.search(dataset['context'], k=args.shot * SHOT_POOL)
+    search_seconds = time.time() - start
+    candidates = [[int(i) for i in rows if pool['context'][i] != dataset['context'][count_row]]
+                  for count_row, (rows, _) in enumerate(neighbours)]
+    rendered = dict(render_shots(args, pool, prompter, sorted({i for rows in candidates for i in rows}), model))
+
+    rows_shots = {}
+    for count_row, rows in enumerate(candidates):
+        shots = [(i, rendered[i]) for i in rows]
+        if shot_budget is not None:
+            shots = prompter.pack_shots(shots, shot_budget, count, args.shot, shortest_first=False)
+        else:
+            shots = shots[:args.shot]
+        rows_shots[count_row] = [i for i, _ in shots]
+    used = {i for rows in rows_shots.values() for i in rows}
+    print(f"Retrieved few-shot examples for {len(neighbours)} rows from a pool of {len(pool['context'])} "
+          f"({search_seconds / max(len(neighbours), 1) * 1000:.2f} ms per row)")
+    # Rows sharing no informative term with enough pool posts are topped up with the first posts of the pool.
+    fallbacks = sum(bool((scores[:args.shot] == 0).any()) for _, scores in neighbours)
+    if fallbacks:
+        print(f"Warning: {fallbacks} of {len(neighbours)} rows matched fewer than {args.shot} pool posts and got "
+              f"unrelated ones in their place.")
+    return RowShots(rows_shots, {i: rendered[i] for i in used})
+
+
+def config_prompts(args, dataset, prompter, model_cls, journal=None, model=None, context=None):
+    # Returns (prompts, shots): the prompt set rows of one config for a model class, fitted to its
+    # token budget, and the rows used as few-shot examples (which get no prompt of their own).
+    # With --shot_selection retrieval every row gets its own examples from the whole dataset (see
+    # load_exemplar_pool) and no row is held out.
+    budget = token_budget(args, model_cls)
+    counter = counter_for(model_cls) if budget else None
+    count = counter.count_text if counter is not None else None
+    shots_budget = shot_budget(args, dataset, prompter, model_cls, budget) if budget and args.shot > 0 else None
+    if args.shot > 0 and args.shot_selection == 'retrieval':
+        pool = context.exemplar_pool(args) if context is not None else load_exemplar_pool(args)
+        row_shots = retrieved_shots(args, dataset, prompter, pool, model, shots_budget, count)
+        prompts = load_prompt_set(args, dataset, prompter, token_budget=budget, model_cls=model_cls,
+                                  row_shots=row_shots)
+        return prompts, []
+    select_shot = select_shots(args, dataset, journal)
+    shot_memory, shot_count, shots = few_shot_memory(args, dataset, prompter, select_shot, model, shots_budget, count)
+    prompts = load_prompt_set(args, dataset, prompter, shot_memory, shot_count, exclude=shots,
+                              token_budget=budget, model_cls=model_cls)
+    return prompts, shots
+
+
+def prepare_config(args, model_name, output_dir, model, context=None):
+    # Returns (dataset, param_dir, queries, journal) for one config, with model configured for it.
+    # Rows the run journal already records as answered with the same prompt are left out of queries.
+    # context (a sweep.SweepContext) shares loaded datasets and prompt generators between the configs of a sweep.
+    dataset = context.dataset(args) if context is not None else load_config_dataset(args)
+
+    model.configure(args)
+    if args.scoring == 'loglik' and not model.supports_scoring:
+        raise ValueError(f"{model_name} cannot score labels by log-likelihood; use --scoring generate")
+    if hasattr(model, 'warm_up'):
+        model.warm_up()
+    prompter = context.prompter(args) if context is not None else build_prompter(args)
+
+    shot_dir = f"PS-{args.PS}_shot-{args.shot}"
+    if args.shot > 0 and args.shot_selection == 'retrieval':
+        # Retrieved few-shot examples get results of their own next to the random ones.
+        shot_dir += '_retrieval'
+    budget = token_budget(args, type(model))
+    if budget:
+        # So do prompts fitted to a token budget, next to those left whole.
+        shot_dir += f"_budget{budget}"
     param_dir = os.path.join(
         output_dir,
         args.data,
         args.problem_task,
         args.SI,
         args.TQ,
-        f"PS-{args.PS}_shot-{args.shot}",
+        shot_dir,
         model_name,
     )
     os.makedirs(param_dir, exist_ok=True)
+    journal = RunJournal(param_dir)
+
+    prompts, shots = config_prompts(args, dataset, prompter, type(model), journal, model, context)
+    truncated = [{'index': prompt['index'], **prompt['truncated']} for prompt in prompts if 'truncated' in prompt]
+    # Retrieved examples are fitted row by row; random ones are the same for every row.
+    row_shots = [len(prompt['shots']) for prompt in prompts if 'shots' in prompt]
+    dropped_shots = min(row_shots) < args.shot if row_shots else len(shots) < args.shot
+    if truncated or (budget and args.shot > 0 and dropped_shots):
+        # Which inputs were cut to fit the token budget, and how far.
+        with open(os.path.join(param_dir, 'truncation.jsonl'), 'w', encoding='utf-8') as f:
+            for record in truncated:
+                f.write(json.dumps(record) + '\n')
+        if not args.shot:
+            fitted = ''
+        elif row_shots:
+            fitted = (f", rows got {min(row_shots)} to {max(row_shots)} of {args.shot} few-shot examples "
+                      f"({sum(row_shots) / len(row_shots):.1f} on average)")
+        else:
+            fitted = f", {len(shots)} of {args.shot} few-shot examples fit"
+        print(f"Token budget {budget}: {len(truncated)} of {len(prompts)} inputs truncated{fitted}.")
+        # An input is only cut entirely when the rest of the prompt leaves no room for it.
+        emptied = sum(record['kept_tokens'] == 0 for record in truncated)
+        over_budget = [record['prompt_tokens'] for record in truncated if record['over_budget']]
+        if emptied:
+            print(f"Warning: {emptied} inputs were cut entirely to fit the token budget."
+                  + (f" {len(over_budget)} prompts are over it even so, at up to {max(over_budget)} tokens."
+                     if over_budget else ''))
 
-    for count in range(len(dataset['context'])):
-        if args.shot > 0 and count in select_shot:
+    queries = []
+    skipped = 0
+    for prompt in prompts:
+        if journal.is_done(prompt['index'], prompt['hash']):
+            skipped += 1
             continue
+        queries.append((prompt['index'], {'system': prompt['system'], 'user': prompt['user'],
+                                          'label_list': prompt['label_list']}))
 
-        context = dataset['context'][count]
-        label = dataset['label'][count]
-        label_text = dataset['label_text'][count]
-        label_list = dataset['label_list'][count]
+    if skipped:
+        print(f"Resuming {param_dir}: {skipped} rows already answered, {len(queries)} to request.")
+    return dataset, param_dir, queries, journal
 
-        if 'subject' in dataset and count < len(dataset['subject']):
-            subject = dataset['subject'][count]
-        else:
-            subject = None  # subject가 없는 경우 None 할당
 
-        query = prompter(
-            shot_memory=shot_memory,
-            context=context,
-            label=label,
-            label_text=label_text,
-            label_list=label_list,
-            subject=subject,
-            shot_count=shot_count
-        )
+def result_record(args, dataset, count, query_text, answer_text, usage=None, latency=None):
+    classification = args.problem_task == 'Classification'
+    usage = usage or {}
+    return {
+        'index': count,
+        'prompt_hash': prompt_hash(query_text),
+        'query': query_text,
+        'answer': answer_text,
+        'true_label': dataset['label_text'][count] if classification else None,
+        'label_list': dataset['label_list'][count] if classification else None,
+        'latency': latency,
+        'input_tokens': usage.get('input_tokens'),
+        'cached_input_tokens': usage.get('cached_input_tokens'),
+        'output_tokens': usage.get('output_tokens'),
+    }
+
+
+def result_writer(args, dataset, param_dir, journal):
+    # Returns (on_result, close) for the answers of one config.
+    store = ResultStore(param_dir) if args.result_format in ('jsonl', 'both') else None
+    if store is not None:
+        journal.stores.append(store)
+    # Per-request token usage, including how much of each prompt the provider served from its cache.
+    usage_file = open(os.path.join(param_dir, 'usage.jsonl'), 'a', encoding='utf-8')
+
+    def on_result(count, response, usage=None, latency=None):
+        query_text, answer_text = response
+        if store is not None:
+            store.append(result_record(args, dataset, count, query_text, answer_text, usage, latency))
+        if args.result_format in ('txt', 'both'):
+            write_result(args, dataset, param_dir, count, query_text, answer_text)
+        if usage is not None:
+            usage_file.write(json.dumps({'index': count, **usage}) + '\n')
+        journal.record(count, prompt_hash(query_text), failed=answer_text == FAILED_RESPONSE)
+
+    def close():
+        # The journal syncs the store before each of its own syncs, so the results are on disk before
+        # the journal says they are done.
+        journal.close()
+        if store is not None:
+            store.close()
+        usage_file.close()
 
-        response = model.response(query)
-        query_text, answer_text = response[0], response[1]
+    return on_result, close
 
-        with open(os.path.join(param_dir, f'query{count}.txt'), 'w', encoding='utf-8') as f:
-            f.write(query_text)
-        with open(os.path.join(param_dir, f'answer{count}.txt'), 'w', encoding='utf-8') as f:
-            f.write(answer_text)
-            if args.problem_task == 'Classification':
-                f.write('\n\n' + 'TrueAnswer:' + str(dataset['label_text'][count]))
-                f.write('\n\n' + 'TrueLabellist:' + str(dataset['label_list'][count]))
 
+def report_finished(model_name, model, param_dir):
     print(f"Model {model_name} finished processing and results saved to {param_dir}.")
+    print(model.usage_report())
+    if model.timing_report() is not None:
+        print(model.timing_report())
+    if model.cache is not None:
+        print(model.cache.report())
 
 
-if __name__ == '__main__':
+def gen(args, model_name, output_dir, model=None, context=None):
+    # worker.py and sweep.py pass the model they already loaded instead of reloading it per config.
+    if model is None:
+        model = load_model(model_name, args)
+    dataset, param_dir, queries, journal = prepare_config(args, model_name, output_dir, model, context)
+    on_result, close = result_writer(args, dataset, param_dir, journal)
+
+    if args.batch:
+        results = batch_runner(model, param_dir, poll_interval=args.batch_poll).run(queries)
+        for count, response in results.items():
+            on_result(count, response)
+    elif hasattr(model, 'batch_response'):
+        for count, response, usage in tqdm(model.batch_response(queries), total=len(queries), desc=model_name):
+            on_result(count, response, usage)
+    else:
+        run_requests(model, queries, on_result, desc=model_name)
+    close()
+
+    report_finished(model_name, model, param_dir)
+    return len(queries)
+
+
+def build_parser():
     parser = argparse.ArgumentParser(description="systematic_evaluation Using SubProcess")
     parser.add_argument('--models', type=str, nargs='+', required=False, choices=['Gemini', 'Sonnet', 'GPT4o','Llama','Gemma','Qwen',
                                                                                   'Ollama_Llama','Ollama_Qwen','Ollama_Gemma', 'Ollama_Mistral','Ollama_Phi',
@@ -135,17 +378,73 @@ if __name__ == '__main__':
     parser.add_argument('--shot', type=int, required=False,
                         default=0, help='if shot > 0 few-shot else zero-shot')
     parser.add_argument('--max_rows', type=int, required=False, default=200, help='Maximum number of rows to load')
+    parser.add_argument('--dataset_revision', type=str, required=False, default='main',
+                        help='Hub revision of the dataset; each revision is snapshotted once under ../cache/datasets')
+    parser.add_argument('--sample_seed', type=int, required=False, default=42, help='Seed of the balanced sampling')
+    parser.add_argument('--sample_replace', type=str, required=False, default='auto',
+                        choices=['auto', 'with', 'without'],
+                        help="Sample labels with or without replacement; 'auto' repeats rows only for labels with too few rows")
+    parser.add_argument('--shot_selection', type=str, required=False, choices=['random', 'retrieval'], default='random',
+                        help="'random' puts the same --shot examples, held out of the evaluation, in front of every "
+                             "prompt; 'retrieval' gives each sample the most similar posts of the whole dataset")
+    parser.add_argument('--token_budget', type=int, required=False, default=None,
+                        help="Fit each prompt into this many tokens by cutting the middle of long posts and packing the "
+                             "shortest few-shot examples (defaults to the model class's context_budget; 0 turns it off)")
+    parser.add_argument('--render_workers', type=int, required=False, default=None,
+                        help='Processes rendering a prompt set of a large dataset (defaults to the CPU count)')
+    parser.add_argument('--concurrency', type=int, required=False, default=None,
+                        help="Requests kept in flight per model (defaults to the model class's concurrency)")
+    parser.add_argument('--cache', type=str, required=False, default='../cache/responses.sqlite',
+                        help='SQLite file used to cache model responses across runs')
+    parser.add_argument('--cache_max_mb', type=int, required=False, default=1024,
+                        help='Evict least recently used responses once the cache grows past this size')
+    parser.add_argument('--no_cache', action='store_true', help='Always query the model, bypassing the cache')
+    parser.add_argument('--rate_limits', type=str, required=False, default='../cache/rate_limits.sqlite',
+                        help='SQLite file holding the per-provider rate limit buckets shared by a sweep')
+    parser.add_argument('--rpm', type=int, required=False, default=None,
+                        help="Requests per minute for the provider (defaults to the model class's quota)")
+    parser.add_argument('--tpm', type=int, required=False, default=None,
+                        help="Tokens per minute for the provider (defaults to the model class's quota)")
+    parser.add_argument('--batch', action='store_true',
+                        help='Submit every prompt of the config through the provider batch API instead of one request each')
+    parser.add_argument('--batch_poll', type=int, required=False, default=30,
+                        help='Seconds between batch status checks')
+    parser.add_argument('--base_url', type=str, required=False, default=None,
+                        help='Override the provider API endpoint, e.g. a local stand-in server')
+    parser.add_argument('--keep_alive', type=str, required=False, default=None,
+                        help="How long Ollama keeps the model loaded after a request, e.g. '30m', or '-1m' to keep it loaded")
+    parser.add_argument('--hf_model_id', type=str, required=False, default=None,
+                        help='Load a different Hugging Face checkpoint for Llama/Qwen/Gemma, e.g. a tiny CPU model')
+    parser.add_argument('--gen_batch_size', type=int, required=False, default=None,
+                        help='Prompts per generate() call for the transformers models')
+    parser.add_argument('--scoring', type=str, required=False, choices=['generate', 'loglik'], default='generate',
+                        help="'loglik' picks the most likely label from label_list instead of generating an answer "
+                             "(transformers models only)")
+    parser.add_argument('--result_format', type=str, required=False, choices=['jsonl', 'txt', 'both'], default='jsonl',
+                        help="'jsonl' writes one results.jsonl per config (export with result_store.py), "
+                             "'txt' the per-sample query/answer files")
     parser.add_argument('--output_structure', type=str, required=False, choices=['index', 'newline'], default='index',
                         help="Structure of the output files: 'index' for indexed format, 'newline' for newline separated format")
 
-    args = parser.parse_args()
+    return parser
+
+
+def parse_args(argv=None, parser=None):
+    parser = parser or build_parser()
+    args = parser.parse_args(argv)
+    if args.shot_selection == 'retrieval' and args.data in CONVERSATION_DATASETS:
+        parser.error(f"--shot_selection retrieval needs one text post per row; {args.data} holds conversations")
+    if args.no_cache:
+        args.cache = None
+    return args
 
-    output_base_dir = '../results'
-    os.makedirs(output_base_dir, exist_ok=True)
 
 def main():
+    args = parse_args()
+    os.makedirs(OUTPUT_BASE_DIR, exist_ok=True)
     with Pool(processes=len(args.models)) as pool:
-        pool.starmap(gen, [(args, model, output_base_dir) for model in args.models])
+        pool.starmap(gen, [(args, model, OUTPUT_BASE_DIR) for model in args.models])
+
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tools'))
+from batch_api import AnthropicBatchRunner, BatchRunner, OpenAIBatchRunner
+from fake_batch_server import FAKE_ANSWER, serve
+from gpt import GPT, Claude
+
+# Drives the batch runners end to end against tools/fake_batch_server.py, including resuming an
+# interrupted batch from batch_state.json. Run from gen_v2/:  python -m unittest discover tests
+
+QUERIES = [(count, {'system': 'You are an annotator.\n', 'user': f"###Input###\nPost {count}\n###Output###\n"})
+           for count in range(3)]
+
+
+class InterruptedAfterSubmit(Exception):
+    pass
+
+
+def interrupted(runner_cls):
+    # A runner that stops, like a killed run, right after the batch was submitted and recorded.
+    class Interrupted(runner_cls):
+        def status(self, batch_id):
+            raise InterruptedAfterSubmit(batch_id)
+    return Interrupted
+
+
+class BatchRunnerTest:
+    model_cls = None
+    runner_cls = None
+    path = ''
+
+    def setUp(self):
+        self.server = serve(0, polls_until_done=2)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(work_dir.cleanup)
+        self.work_dir = work_dir.name
+        base_url = f"http://127.0.0.1:{self.server.server_address[1]}{self.path}"
+        self.model = self.model_cls(api_key='test', args=argparse.Namespace(shot=0, base_url=base_url))
+
+    def batches(self):
+        return self.server.RequestHandlerClass.state.batches
+
+    def test_run(self):
+        results = self.runner_cls(self.model, self.work_dir, poll_interval=0).run(QUERIES)
+        self.assertEqual(sorted(results), [0, 1, 2])
+        for count, query in QUERIES:
+            self.assertEqual(results[count], (query['system'] + query['user'], FAKE_ANSWER))
+        with open(os.path.join(self.work_dir, 'batch_state.json'), 'r', encoding='utf-8') as f:
+            self.assertIn('finished', json.load(f))
+
+    def test_resume_after_interruption(self):
+        with self.assertRaises(InterruptedAfterSubmit) as raised:
+            interrupted(self.runner_cls)(self.model, self.work_dir, poll_interval=0).run(QUERIES)
+        batch_id = raised.exception.args[0]
+
+        results = self.runner_cls(self.model, self.work_dir, poll_interval=0).run(QUERIES)
+        self.assertEqual({count: answer for count, (_, answer) in results.items()},
+                         {count: FAKE_ANSWER for count, _ in QUERIES})
+        # The resumed run polled the batch of the interrupted one instead of submitting another.
+        self.assertEqual(list(self.batches()), [batch_id])
+
+    def test_changed_prompts_get_a_new_batch(self):
+        self.runner_cls(self.model, self.work_dir, poll_interval=0).run(QUERIES)
+        self.runner_cls(self.model, self.work_dir, poll_interval=0).run(QUERIES[:2])
+        self.assertEqual(len(self.batches()), 2)
+
+
+@unittest.skipUnless(importlib.util.find_spec('openai'), 'openai is not installed')
+class OpenAIBatchRunnerTest(BatchRunnerTest, unittest.TestCase):
+    model_cls = GPT
+    runner_cls = OpenAIBatchRunner
+    path = '/v1'
+
+
+@unittest.skipUnless(importlib.util.find_spec('anthropic'), 'anthropic is not installed')
+class AnthropicBatchRunnerTest(BatchRunnerTest, unittest.TestCase):
+    model_cls = Claude
+    runner_cls = AnthropicBatchRunner
+
+
+class AbstractRunnerTest(unittest.TestCase):
+    def test_runner_needs_a_provider(self):
+        with self.assertRaises(TypeError):
+            BatchRunner(None, '.')
+
+
+if __name__ == '__main__':
+    unittest.main()
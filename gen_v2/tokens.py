@@ -0,0 +1,80 @@
+import math
+
+from gpt import GPT, INPUT_MARKER, TransformersBase
+
+# Local token counts for planning (estimate.py); nothing is sent to a provider. GPT models use
+# tiktoken and the transformers models their own tokenizer when it is already downloaded; otherwise,
+# and for Claude, Gemini and Ollama, which have no local tokenizer here, the count is estimated from
+# the number of characters.
+
+# Characters per token of English prompt text, for the estimate.
+CHARS_PER_TOKEN = {'Claude': 3.5}
+DEFAULT_CHARS_PER_TOKEN = 4.0
+
+
+class TokenCounter:
+    def __init__(self, name, encode_batch=None, chars_per_token=DEFAULT_CHARS_PER_TOKEN):
+        self.name = name
+        self.encode_batch = encode_batch
+        self.chars_per_token = chars_per_token
+        # Prompt parts shared by every row of a config are counted once.
+        self.shared = {}
+
+    def count(self, texts):
+        if self.encode_batch is None:
+            return [math.ceil(len(text) / self.chars_per_token) for text in texts]
+        return [len(tokens) for tokens in self.encode_batch(texts)]
+
+    def count_text(self, text):
+        return self.count([text])[0]
+
+    def count_shared(self, text):
+        if text not in self.shared:
+            self.shared[text] = self.count([text])[0]
+        return self.shared[text]
+
+    def count_prompts(self, prompts):
+        # Input tokens of each rendered prompt (system, user). The user prompt is split at the input
+        # marker so its few-shot prefix is tokenized once, which can be off by a token at the seam.
+        inputs = []
+        for system_prompt, user_prompt in prompts:
+            marker = user_prompt.find(INPUT_MARKER)
+            prefix, suffix = (user_prompt[:marker], user_prompt[marker:]) if marker > 0 else ('', user_prompt)
+            inputs.append((self.count_shared(system_prompt) + self.count_shared(prefix), suffix))
+        counts = self.count([suffix for _, suffix in inputs])
+        return [shared + count for (shared, _), count in zip(inputs, counts)]
+
+
+def tiktoken_counter(model_id):
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model_id)
+        except KeyError:
+            encoding = tiktoken.get_encoding('o200k_base')
+    except Exception:
+        # Not installed, or the encoding file is not cached and there is no network.
+        return None
+    return TokenCounter(f"tiktoken:{encoding.name}", encoding.encode_ordinary_batch)
+
+
+def hf_counter(model_id):
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_id, local_files_only=True)
+    except Exception:
+        return None
+    return TokenCounter(f"hf:{model_id}",
+                        lambda texts: tokenizer(texts, add_special_tokens=False)['input_ids'])
+
+
+def counter_for(cls):
+    counter = None
+    if issubclass(cls, GPT):
+        counter = tiktoken_counter(cls.model_id)
+    elif issubclass(cls, TransformersBase):
+        counter = hf_counter(cls.model_id)
+    if counter is None:
+        chars_per_token = CHARS_PER_TOKEN.get(cls.__name__, DEFAULT_CHARS_PER_TOKEN)
+        counter = TokenCounter(f"~{chars_per_token:g} chars/token", chars_per_token=chars_per_token)
+    return counter
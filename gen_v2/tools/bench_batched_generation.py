@@ -0,0 +1,52 @@
+import argparse
+import os
+import random
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gpt import Llama
+
+# Compares per-prompt generation (batch size 1) with length-bucketed batches on CPU.
+# Run from gen_v2/:  python tools/bench_batched_generation.py --rows 64
+
+
+def make_queries(rows):
+    random.seed(0)
+    words = 'i feel happy sad angry tired today because work friends family weather news'.split()
+    queries = []
+    for count in range(rows):
+        post = ' '.join(random.choice(words) for _ in range(random.randint(5, 200)))
+        queries.append((count, {
+            'system_instruction': 'You are an expert system specializing in emotion classification.',
+            'task_query': 'Classify the emotion of the post.',
+            'few_shot': '',
+            'prompt_strategy': '',
+            'context': f"Post: {post}",
+            'label_def': '',
+            'output_indicator': 'Answer with Label and Confidence Score.',
+        }))
+    return queries
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark batched generation for the transformers models')
+    parser.add_argument('--model_id', type=str, default='hf-internal-testing/tiny-random-LlamaForCausalLM')
+    parser.add_argument('--rows', type=int, default=64)
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--max_new_tokens', type=int, default=16)
+    args = parser.parse_args()
+
+    model_args = types.SimpleNamespace(shot=0, hf_model_id=args.model_id)
+    model = Llama(api_key='', args=model_args)
+    model.generation_params = {'max_new_tokens': args.max_new_tokens, 'do_sample': False}
+    queries = make_queries(args.rows)
+
+    for batch_size in args.batch_sizes:
+        model.batch_size = batch_size
+        start = time.perf_counter()
+        results = list(model.batch_response(queries))
+        elapsed = time.perf_counter() - start
+        assert [key for key, _, _ in results] == [key for key, _ in queries]
+        print(f"batch_size={batch_size:<3} {elapsed:7.2f}s  {args.rows / elapsed:7.1f} prompts/s")
@@ -0,0 +1,110 @@
+import argparse
+import ast
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prompt_gen import Prompt_Generator, compile_template, conditional_format, render
+
+# Per-prompt render cost of Prompt_Generator.__call__ before (every template re-parsed and label_def
+# re-evaluated on each call) and after (compiled render plans), for every option of every template
+# family. The outputs of both are compared for each prompt.
+# Run from gen_v2/:  python tools/bench_prompt_render.py --prompts 2000
+
+TEMPLATE_DIR = '../prompt_template_v2'
+FAMILIES = {'SI': 'System_Instruction.json', 'TQ': 'Task_Query.json', 'PS': 'Prompt_Strategy.json',
+            'CT': 'Context_Input.json', 'LD': 'Label_Def.json', 'OI': 'Output_Indicator.json'}
+
+
+def legacy_call(prompter, shot_memory='', context='', label_text='', label_list='', subject='', shot_mode='basic',
+                shot_count=0):
+    template = prompter.prompt_template
+    fields = {'context': context, 'subject': subject, 'label_list': label_list, 'label_text': label_text}
+    shot = conditional_format(template['few_shot'], shot_memory=shot_memory)
+    system_instruction = conditional_format(template['system_instruction'], **fields)
+    task_query = conditional_format(template['task_query'], **fields)
+    prompt_strategy = conditional_format(template['prompt_strategy'], **fields)
+    label_def = ast.literal_eval(template['label_def'].replace('‘', "'").replace('’', "'"))
+    label_list_for_label_def = [word.strip() for item in label_list for word in item.split('&')]
+    label_def_context = {i: label_def[i] for i in label_list_for_label_def if i in label_def}
+    if len(label_def_context.keys()) == 0:
+        label_def_context = ''
+    output_indicator = conditional_format(template['output_indicator'], **fields)
+    if shot_mode == 'few_shot':
+        system_instruction = task_query = prompt_strategy = output_indicator = ''
+        context = conditional_format(template['prompt_strategy'], **fields)
+    else:
+        if shot_count != 0:
+            prompt_strategy = ''
+        context = conditional_format(template['context'], **fields)
+    return {'few_shot': shot, 'system_instruction': system_instruction, 'task_query': task_query,
+            'prompt_strategy': prompt_strategy, 'context': context, 'label_def': label_def_context,
+            'output_indicator': output_indicator, 'label_list': label_list}
+
+
+# Template shapes none of the shipped templates use yet, checked against conditional_format too.
+EDGE_TEMPLATES = ['JSON like {{"label": "joy"}} here', '{{literal}} then {context}', '{context} and {{', '', 'plain']
+
+
+def options(template, path=()):
+    if isinstance(template, dict):
+        for key, value in template.items():
+            yield from options(value, path + (key,))
+    else:
+        yield '-'.join(path)
+
+
+def make_samples(count, label_list):
+    random.seed(0)
+    words = 'i feel happy sad angry tired today because work friends family weather news'.split()
+    return [{'context': ' '.join(random.choice(words) for _ in range(random.randint(5, 200))),
+             'label_text': random.choice(label_list), 'label_list': label_list, 'subject': 'Speaker A',
+             'shot_memory': 'Example post\nLabel: joy' if i % 2 else '', 'shot_count': i % 2,
+             'shot_mode': 'few_shot' if i % 5 == 0 else 'basic'} for i in range(count)]
+
+
+def timed(render, prompter, samples):
+    start = time.perf_counter()
+    outputs = [render(prompter, **sample) for sample in samples]
+    return (time.perf_counter() - start) / len(samples), outputs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark Prompt_Generator rendering before and after compilation')
+    parser.add_argument('--prompts', type=int, default=2000, help='Prompts rendered per template option')
+    args = parser.parse_args()
+
+    for template in EDGE_TEMPLATES:
+        for context in ('', 'a post'):
+            assert render(compile_template(template), context=context) == conditional_format(template, context=context), \
+                f"{template!r} renders differently"
+
+    label_list = ['admiration', 'joy', 'sadness', 'anger', 'yes', 'no', 'depression', 'suicidal', 'Supportive']
+    samples = make_samples(args.prompts, label_list)
+    print(f"{'task':<32} {'family':<7} {'options':>7} {'before us':>10} {'after us':>9} {'speedup':>8}")
+    for directory in sorted(glob.glob(os.path.join(TEMPLATE_DIR, '*', '*'))):
+        data_task, problem_task = directory.split(os.sep)[-2:]
+        families = {}
+        for family, filename in FAMILIES.items():
+            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+                families[family] = list(options(json.load(f)))
+        defaults = {family: choices[0] for family, choices in families.items()}
+
+        for family, choices in families.items():
+            before, after = 0.0, 0.0
+            for choice in choices:
+                combo = dict(defaults, **{family: choice})
+                prompter = Prompt_Generator(data_task, problem_task, 'bench', combo['SI'], combo['TQ'],
+                                            combo['PS'], combo['CT'], combo['LD'], combo['OI'])
+                legacy_cost, expected = timed(legacy_call, prompter, samples)
+                compiled_cost, rendered = timed(Prompt_Generator.__call__, prompter, samples)
+                assert rendered == expected, f"{data_task}/{problem_task} {family}={choice} renders differently"
+                before += legacy_cost
+                after += compiled_cost
+            before, after = before / len(choices), after / len(choices)
+            print(f"{data_task + '/' + problem_task:<32} {family:<7} {len(choices):>7} {before * 1e6:>10.1f} "
+                  f"{after * 1e6:>9.1f} {before / after:>7.1f}x")
@@ -0,0 +1,40 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+import datasets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dataset import preprocess_data_with_balanced_sampling
+
+# Times preprocess_data_with_balanced_sampling on a synthetic dreaddit-shaped dataset; the cost per
+# sampled row should stay flat as max_rows grows.
+# Run from gen_v2/:  python tools/bench_sampling.py --dataset_rows 100000
+
+
+def make_dataset(rows):
+    random.seed(0)
+    words = 'i feel happy sad angry tired today because work friends family weather news'.split()
+    labels = [random.randint(0, 1) for _ in range(rows)]
+    return datasets.DatasetDict({'train': datasets.Dataset.from_dict({
+        'post': [' '.join(random.choice(words) for _ in range(random.randint(5, 200))) for _ in range(rows)],
+        'label': labels,
+        'label_text': ['yes' if label == 0 else 'no' for label in labels],
+    })})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark balanced sampling over growing max_rows')
+    parser.add_argument('--dataset_rows', type=int, default=100000)
+    parser.add_argument('--max_rows', type=int, nargs='+', default=[200, 2000, 20000])
+    args = parser.parse_args()
+
+    dataset = make_dataset(args.dataset_rows)
+    for max_rows in args.max_rows:
+        start = time.perf_counter()
+        data = preprocess_data_with_balanced_sampling('dreaddit', dataset, max_rows=max_rows)
+        elapsed = time.perf_counter() - start
+        assert len(data['context']) == min(max_rows, args.dataset_rows)
+        print(f"max_rows={max_rows:<6} {elapsed:8.3f}s  {elapsed / max_rows * 1e6:8.1f} us/row")
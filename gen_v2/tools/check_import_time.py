@@ -0,0 +1,48 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Times a cold start of systematic_evaluation (fresh interpreter, as the auto_run scripts launch it)
+# and fails if importing it for a GPT run pulls in a provider SDK that run does not use.
+# Run from gen_v2/:  python tools/check_import_time.py
+
+GEN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What load_model('GPT4o') imports on top of the module-level imports.
+PROBE = '''
+import sys, time
+start = time.perf_counter()
+import gpt
+import systematic_evaluation
+import openai
+elapsed = time.perf_counter() - start
+loaded = [name for name in {forbidden!r} if name in sys.modules]
+print(f"{{elapsed:.3f}} {{','.join(loaded)}}")
+'''
+
+FORBIDDEN = ['torch', 'transformers', 'anthropic', 'google.generativeai', 'ollama']
+
+
+def measure():
+    result = subprocess.run([sys.executable, '-c', PROBE.format(forbidden=FORBIDDEN)], cwd=GEN_DIR,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    elapsed, _, loaded = result.stdout.strip().splitlines()[-1].partition(' ')
+    return float(elapsed), [name for name in loaded.split(',') if name]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the startup cost of a GPT-only systematic_evaluation run')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    timings = []
+    for _ in range(args.runs):
+        elapsed, loaded = measure()
+        if loaded:
+            print(f"FAIL: a GPT-only run imported {', '.join(loaded)}")
+            sys.exit(1)
+        timings.append(elapsed)
+    print(f"Import time over {args.runs} runs: best {min(timings):.3f}s, worst {max(timings):.3f}s")
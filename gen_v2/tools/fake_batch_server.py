@@ -0,0 +1,201 @@
+import argparse
+import email.parser
+import email.policy
+import itertools
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the provider batch endpoints, for exercising --batch without spending quota:
+#   python tools/fake_batch_server.py --port 8910
+#   python systematic_evaluation.py --models GPT4o --batch --batch_poll 1 --base_url http://127.0.0.1:8910/v1 --no_cache
+#   python systematic_evaluation.py --models Sonnet --batch --batch_poll 1 --base_url http://127.0.0.1:8910 --no_cache
+# (the OpenAI client expects the /v1 prefix in base_url, the Anthropic client adds it itself)
+# Every request is answered with a fixed, parseable classification answer.
+
+FAKE_ANSWER = "Label: neutral\nConfidence Score: 0.5"
+
+
+class FakeBatchState:
+    def __init__(self, polls_until_done=2):
+        self.polls_until_done = polls_until_done
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.files = {}
+        self.batches = {}
+
+    def new_id(self, prefix):
+        return f"{prefix}-{next(self.ids)}"
+
+
+class FakeBatchHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, text):
+        body = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/jsonl')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_POST(self):
+        body = self._read_body()
+        path = self.path.split('?')[0]
+        if path == '/v1/files':
+            self._upload_file(body)
+        elif path == '/v1/batches':
+            self._create_openai_batch(json.loads(body))
+        elif path == '/v1/messages/batches':
+            self._create_anthropic_batch(json.loads(body))
+        else:
+            self._send_json({'error': {'message': f"Unknown path {self.path}"}}, status=404)
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        match = re.fullmatch(r'/v1/batches/([\w-]+)', path)
+        if match:
+            self._retrieve_openai_batch(match.group(1))
+            return
+        match = re.fullmatch(r'/v1/files/([\w-]+)/content', path)
+        if match and match.group(1) in self.state.files:
+            self._send_text(self.state.files[match.group(1)]['content'])
+            return
+        match = re.fullmatch(r'/v1/messages/batches/([\w-]+)', path)
+        if match:
+            self._retrieve_anthropic_batch(match.group(1))
+            return
+        match = re.fullmatch(r'/v1/messages/batches/([\w-]+)/results', path)
+        if match:
+            self._send_text(self.state.batches[match.group(1)]['results'])
+            return
+        self._send_json({'error': {'message': f"Unknown path {self.path}"}}, status=404)
+
+    def _upload_file(self, body):
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode('utf-8')
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(header + body)
+        fields = {part.get_param('name', header='content-disposition'): part for part in message.iter_parts()}
+        content = fields['file'].get_payload(decode=True).decode('utf-8')
+        with self.state.lock:
+            file_id = self.state.new_id('file')
+            self.state.files[file_id] = {'content': content, 'filename': fields['file'].get_filename()}
+        self._send_json({'id': file_id, 'object': 'file', 'bytes': len(content), 'created_at': int(time.time()),
+                         'filename': fields['file'].get_filename(), 'purpose': 'batch', 'status': 'processed'})
+
+    def _openai_batch(self, batch):
+        return {'id': batch['id'], 'object': 'batch', 'endpoint': batch['endpoint'],
+                'input_file_id': batch['input_file_id'], 'completion_window': batch['completion_window'],
+                'status': batch['status'], 'output_file_id': batch.get('output_file_id'),
+                'error_file_id': None, 'created_at': batch['created_at'],
+                'request_counts': {'total': batch['total'], 'completed': batch['completed'], 'failed': 0}}
+
+    def _create_openai_batch(self, payload):
+        with self.state.lock:
+            lines = self.state.files[payload['input_file_id']]['content'].splitlines()
+            batch = {'id': self.state.new_id('batch'), 'endpoint': payload['endpoint'],
+                     'input_file_id': payload['input_file_id'], 'completion_window': payload['completion_window'],
+                     'status': 'validating', 'created_at': int(time.time()), 'polls': 0,
+                     'total': len([line for line in lines if line.strip()]), 'completed': 0}
+            self.state.batches[batch['id']] = batch
+        self._send_json(self._openai_batch(batch))
+
+    def _retrieve_openai_batch(self, batch_id):
+        with self.state.lock:
+            batch = self.state.batches[batch_id]
+            batch['polls'] += 1
+            if batch['status'] != 'completed' and batch['polls'] >= self.state.polls_until_done:
+                self._complete_openai_batch(batch)
+            elif batch['status'] == 'validating':
+                batch['status'] = 'in_progress'
+        self._send_json(self._openai_batch(batch))
+
+    def _complete_openai_batch(self, batch):
+        output = []
+        for line in self.state.files[batch['input_file_id']]['content'].splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            output.append(json.dumps({
+                'id': f"response-{request['custom_id']}",
+                'custom_id': request['custom_id'],
+                'response': {'status_code': 200, 'body': {
+                    'object': 'chat.completion', 'model': request['body']['model'],
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': FAKE_ANSWER}}],
+                }},
+                'error': None,
+            }))
+        output_id = self.state.new_id('file')
+        self.state.files[output_id] = {'content': '\n'.join(output) + '\n', 'filename': 'output.jsonl'}
+        batch['output_file_id'] = output_id
+        batch['completed'] = batch['total']
+        batch['status'] = 'completed'
+
+    def _anthropic_batch(self, batch):
+        ended = batch['processing_status'] == 'ended'
+        results_url = f"http://{self.headers['Host']}/v1/messages/batches/{batch['id']}/results" if ended else None
+        return {'id': batch['id'], 'type': 'message_batch', 'processing_status': batch['processing_status'],
+                'request_counts': {'processing': 0 if ended else batch['total'],
+                                   'succeeded': batch['total'] if ended else 0,
+                                   'errored': 0, 'canceled': 0, 'expired': 0},
+                'created_at': batch['created_at'], 'expires_at': batch['created_at'],
+                'ended_at': batch['created_at'] if ended else None, 'cancel_initiated_at': None,
+                'archived_at': None, 'results_url': results_url}
+
+    def _create_anthropic_batch(self, payload):
+        with self.state.lock:
+            batch = {'id': self.state.new_id('msgbatch'), 'processing_status': 'in_progress', 'polls': 0,
+                     'created_at': datetime.now(timezone.utc).isoformat(), 'total': len(payload['requests']),
+                     'requests': payload['requests']}
+            self.state.batches[batch['id']] = batch
+        self._send_json(self._anthropic_batch(batch))
+
+    def _retrieve_anthropic_batch(self, batch_id):
+        with self.state.lock:
+            batch = self.state.batches[batch_id]
+            batch['polls'] += 1
+            if batch['processing_status'] != 'ended' and batch['polls'] >= self.state.polls_until_done:
+                batch['results'] = ''.join(json.dumps({
+                    'custom_id': request['custom_id'],
+                    'result': {'type': 'succeeded', 'message': {
+                        'id': f"msg-{request['custom_id']}", 'type': 'message', 'role': 'assistant',
+                        'model': request['params']['model'], 'stop_reason': 'end_turn', 'stop_sequence': None,
+                        'content': [{'type': 'text', 'text': FAKE_ANSWER}],
+                        'usage': {'input_tokens': 0, 'output_tokens': 0},
+                    }},
+                }) + '\n' for request in batch['requests'])
+                batch['processing_status'] = 'ended'
+        self._send_json(self._anthropic_batch(batch))
+
+
+def serve(port, polls_until_done=2):
+    FakeBatchHandler.state = FakeBatchState(polls_until_done)
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeBatchHandler)
+    print(f"Fake batch server listening on http://127.0.0.1:{server.server_address[1]}")
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for provider batch APIs')
+    parser.add_argument('--port', type=int, default=8910)
+    parser.add_argument('--polls_until_done', type=int, default=2,
+                        help='Status checks a batch reports as in progress before completing')
+    args = parser.parse_args()
+    serve(args.port, args.polls_until_done).serve_forever()
@@ -0,0 +1,153 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from multiprocessing.connection import Client, Listener
+
+from gpt import load_model
+from sweep import SweepContext
+from systematic_evaluation import OUTPUT_BASE_DIR, build_parser, parse_args
+
+# A long-lived process that loads one model once and runs every config of a sweep against it,
+# instead of one systematic_evaluation subprocess (and one model load) per config.
+# The auto_run drivers start it through WorkerClient; it can also be run by hand:
+#   python worker.py --models Llama --port 6100
+# and fed configs with WorkerClient('Llama', port=6100, spawn=False).
+
+AUTHKEY = b'LLM-emotion-recognition'
+# Options the model is loaded with; a config asking for other values needs a worker of its own.
+# The response cache and rate limits are set per config (BaseModel.configure).
+LOAD_OPTIONS = ('hf_model_id', 'base_url')
+# Seconds between checks whether an idle worker should exit.
+WATCH_INTERVAL = 5
+
+
+def run_job(model, model_name, context, argv, worker_args):
+    # Returns None on success, otherwise the error text for the client.
+    try:
+        args = parse_args(argv)
+        if args.models != [model_name]:
+            return f"This worker serves {model_name}, not {' '.join(args.models)}"
+        for option in LOAD_OPTIONS:
+            if getattr(args, option) != getattr(worker_args, option):
+                return (f"This worker loaded {model_name} with --{option} {getattr(worker_args, option)}, "
+                        f"not {getattr(args, option)}")
+        context.run(args, model_name, model)
+    except (Exception, SystemExit):
+        return traceback.format_exc()
+    return None
+
+
+def watch(state, idle_timeout, parent_pid):
+    # Ends the worker once nothing will send it configs any more: the process that started it has
+    # exited, or no config arrived for idle_timeout seconds. A config being run is finished first.
+    while True:
+        time.sleep(WATCH_INTERVAL)
+        with state['lock']:
+            if state['busy']:
+                continue
+            if parent_pid and os.getppid() != parent_pid:
+                print(f"Worker exiting: its client (pid {parent_pid}) is gone", flush=True)
+                os._exit(0)
+            if idle_timeout and time.time() - state['last_job'] > idle_timeout:
+                print(f"Worker exiting after {idle_timeout}s without a config", flush=True)
+                os._exit(0)
+
+
+def serve(args):
+    model_name = args.models[0]
+    os.makedirs(OUTPUT_BASE_DIR, exist_ok=True)
+    start = time.time()
+    model = load_model(model_name, args)
+    print(f"Worker loaded {model_name} in {time.time() - start:.1f}s", flush=True)
+    context = SweepContext()
+    state = {'lock': threading.Lock(), 'busy': False, 'last_job': time.time()}
+    threading.Thread(target=watch, args=(state, args.idle_timeout, args.parent_pid), daemon=True).start()
+
+    with Listener(('localhost', args.port), authkey=AUTHKEY) as listener:
+        print(f"Worker for {model_name} listening on localhost:{args.port}", flush=True)
+        while True:
+            with listener.accept() as conn:
+                while True:
+                    try:
+                        command, argv = conn.recv()
+                    except EOFError:
+                        break
+                    if command == 'stop':
+                        model.close()
+                        print(context.report(), flush=True)
+                        return
+                    with state['lock']:
+                        state['busy'] = True
+                    try:
+                        error = run_job(model, model_name, context, argv, args)
+                    finally:
+                        with state['lock']:
+                            state['busy'] = False
+                            state['last_job'] = time.time()
+                    conn.send(error)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+class WorkerClient:
+    # Starts (or attaches to) a worker for one model and sends it configs as systematic_evaluation
+    # argument lists. Use as a context manager; leaving it stops the worker.
+    def __init__(self, model_name, worker_args=(), port=None, spawn=True):
+        self.model_name = model_name
+        self.worker_args = list(worker_args)
+        self.port = port or free_port()
+        self.spawn = spawn
+        self.process = None
+        self.conn = None
+
+    def __enter__(self):
+        if self.spawn:
+            command = [sys.executable, 'worker.py', '--models', self.model_name, '--port', str(self.port),
+                       '--parent_pid', str(os.getpid())]
+            self.process = subprocess.Popen(command + self.worker_args)
+        # The worker only starts listening once the model is loaded, which can take minutes.
+        while self.conn is None:
+            try:
+                self.conn = Client(('localhost', self.port), authkey=AUTHKEY)
+            except ConnectionRefusedError:
+                if self.process is not None and self.process.poll() is not None:
+                    raise RuntimeError(f"Worker for {self.model_name} exited with code {self.process.returncode}")
+                time.sleep(1)
+        return self
+
+    def run(self, command):
+        # Runs one config; returns None on success or the worker's error text.
+        self.conn.send(('run', ['--models', self.model_name] + list(command)))
+        return self.conn.recv()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.conn is not None:
+            try:
+                self.conn.send(('stop', None))
+            except OSError:
+                pass
+            self.conn.close()
+        if self.process is not None:
+            self.process.wait()
+
+
+if __name__ == '__main__':
+    parser = build_parser()
+    parser.description = 'Serve systematic_evaluation configs from one loaded model'
+    parser.add_argument('--port', type=int, required=True, help='Local port to accept configs on')
+    parser.add_argument('--idle_timeout', type=int, required=False, default=1800,
+                        help='Exit after this many seconds without a config (0 waits forever)')
+    parser.add_argument('--parent_pid', type=int, required=False, default=None,
+                        help='Exit once this process (the client that started the worker) has exited')
+    worker_args = parse_args(parser=parser)
+    if len(worker_args.models) != 1:
+        parser.error('a worker serves exactly one model')
+    serve(worker_args)
@@ -1,5 +1,6 @@
 import pandas as pd
 from datasets import Dataset
+from publish import publish
 
 file = '../data/CDSNL/combined-set.csv'
 df=pd.read_csv(file)
@@ -14,5 +15,6 @@ data = {'title': title, 'text': text, 'label': label, 'label_text': label_text}
 
 df = pd.DataFrame(data)
 dataset = Dataset.from_pandas(df)
-dataset.push_to_hub("KAIST-IC-LAB721/CDSNL")
+# gen_v2 loads this data as SDCNL.
+publish(dataset, "KAIST-IC-LAB721/CDSNL", snapshot_as="KAIST-IC-LAB721/SDCNL")
 print('debug')
@@ -1,5 +1,6 @@
 import pandas as pd
 from datasets import Dataset
+from publish import publish
 
 label_rate = {0:'Supportive', 1: 'Indicator', 2:'Ideation', 3:'Behavior', 4:'Attempt'}
 label_rate_reverse = {v:k for k,v in label_rate.items()}
@@ -12,5 +13,5 @@ data = {'Post': clear_post, 'label': [label_rate_reverse[lbl] for lbl in list(df
 
 df = pd.DataFrame(data)
 dataset = Dataset.from_pandas(df)
-dataset.push_to_hub("KAIST-IC-LAB721/CSSRS-Suicide")
+publish(dataset, "KAIST-IC-LAB721/CSSRS-Suicide")
 print('debug')
@@ -2,6 +2,7 @@ import json
 
 import pandas as pd
 from datasets import Dataset
+from publish import publish
 
 with open('../data/emobench/ea_data.json', encoding='UTF-8') as json_file:
     ea_data = json.load(json_file)
@@ -66,7 +67,7 @@ for data in eu_data:
 
 df = pd.DataFrame(pandas_eu_data)
 dataset = Dataset.from_pandas(df)
-dataset.push_to_hub("KAIST-IC-LAB721/EmoBench-eu")
+publish(dataset, "KAIST-IC-LAB721/EmoBench-eu")
 
 
 print('debug')
\ No newline at end of file
@@ -1,6 +1,7 @@
 import pickle
 import pandas as pd
 from datasets import Dataset
+from publish import publish
 
 
 def transform_labels(group_label, emotions):
@@ -32,7 +33,7 @@ for sentences,labels in zip(sentence_data,label_data):
 
 df = pd.DataFrame(pandas_data)
 dataset = Dataset.from_pandas(df)
-dataset.push_to_hub("KAIST-IC-LAB721/EmoryNLP-Classification")
+publish(dataset, "KAIST-IC-LAB721/EmoryNLP-Classification")
 
 ### conversation ###
 pandas_conversation = {'conversation':[], 'label':[],'label_text':[],'group_label': [], 'group_text': []}
@@ -46,6 +47,6 @@ for sentences,labels in zip(sentence_data,label_data):
 	pandas_conversation['group_text'].append([group_label_info[text] for text in transform_labels(group_label, [label_info[text] for text in label])])
 df = pd.DataFrame(pandas_conversation)
 dataset = Dataset.from_pandas(df)
-dataset.push_to_hub("KAIST-IC-LAB721/EmoryNLP-Conversation")
+publish(dataset, "KAIST-IC-LAB721/EmoryNLP-Conversation")
 
 print('debug')
\ No newline at end of file
@@ -1,6 +1,7 @@
 import pickle
 import pandas as pd
 from datasets import Dataset
+from publish import publish
 
 label_info = {0: 'happy', 1: 'sad', 2: 'neutral', 3: 'angry', 4: 'excited', 5: 'frustrated'}
 
@@ -20,7 +21,7 @@ for sentences,labels in zip(sentence_data,label_data):
 
 df = pd.DataFrame(pandas_data)
 dataset = Dataset.from_pandas(df)
-dataset.push_to_hub("KAIST-IC-LAB721/IEMOCAP-Classification")
+publish(dataset, "KAIST-IC-LAB721/IEMOCAP-Classification")
 
 ### conversation ###
 pandas_conversation = {'conversation':[],'label':[], 'label_text':[]}
@@ -33,6 +34,6 @@ for sentences,labels in zip(sentence_data,label_data):
 
 df = pd.DataFrame(pandas_conversation)
 dataset = Dataset.from_pandas(df)
-dataset.push_to_hub("KAIST-IC-LAB721/IEMOCAP-Conversation")
+publish(dataset, "KAIST-IC-LAB721/IEMOCAP-Conversation")
 
 print('debug')
\ No newline at end of file
@@ -0,0 +1,18 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'gen_v2'))
+from dataset import save_snapshot
+
+# Run a preprocess script with --snapshot to write its dataset into the local snapshot cache that
+# gen_v2/dataset.load_dataset reads, instead of pushing it to the hub:
+#   python preprocess_cssr.py --snapshot
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache', 'datasets')
+
+
+def publish(dataset, repo_id, snapshot_as=None):
+    if '--snapshot' in sys.argv:
+        path = save_snapshot(dataset, snapshot_as or repo_id, root=SNAPSHOT_DIR)
+        print(f"Saved snapshot {path}")
+    else:
+        dataset.push_to_hub(repo_id)